@@ -0,0 +1,128 @@
+import numpy as np
+from beckend import registry
+
+
+class BatchResult:
+    def __init__(self, energy, yields, flux, kerma_rate, dose_rate):
+        self._energy = energy
+        self._yields = yields
+        self._flux = flux
+        self._kerma_rate = kerma_rate
+        self._dose_rate = dose_rate
+
+    @property
+    def energy(self):
+        return self._energy
+
+    @property
+    def yields(self):
+        return self._yields
+
+    @property
+    def flux(self):
+        return self._flux
+
+    @property
+    def kerma_rate(self):
+        return self._kerma_rate
+
+    @property
+    def dose_rate(self):
+        return self._dose_rate
+
+    @property
+    def total_flux(self):
+        return np.sum(self._flux, axis=-1)
+
+    @property
+    def total_kerma_rate(self):
+        return np.sum(self._kerma_rate, axis=-1)
+
+    @property
+    def total_dose_rate(self):
+        return np.sum(self._dose_rate, axis=-1)
+
+
+class BatchEngine:
+    def __init__(self, database):
+        self._database = database
+        self._lines = {}
+
+    @property
+    def database(self):
+        return self._database
+
+    def lines(self, name):
+        if name not in self._lines:
+            lines = np.asarray(self._database.read('Lines', name), dtype=float)
+            self._lines[name] = lines.reshape(-1, 2)
+        return self._lines[name]
+
+    def halflife(self, name):
+        return float(self._database.halflife_of(name))
+
+    def materials(self):
+        return [str(name) for name in self._database.materials]
+
+    def material(self, name):
+        return registry.table(self._database, 'Materials', name)
+
+    def dose_type(self, name):
+        return registry.table(self._database, 'DoseConversionCoefficients', name)
+
+    def line_table(self, isotopes):
+        lines = [self.lines(name) for name in isotopes]
+        width = max([len(line) for line in lines] + [1])
+        energy = np.ones((len(lines), width))
+        yields = np.zeros((len(lines), width))
+        for i, line in enumerate(lines):
+            energy[i, :len(line)] = line[:, 0]
+            if len(line):
+                energy[i, len(line):] = line[-1, 0]
+            yields[i, :len(line)] = line[:, 1]
+        return energy, yields
+
+    def line_values(self, coefficients, isotopes, energy):
+        values = np.zeros(energy.shape)
+        for i, name in enumerate(isotopes):
+            count = len(self.lines(name))
+            values[i, :count] = registry.values(coefficients, energy[i, :count])
+        return values
+
+    def material_values(self, materials, isotopes, energy):
+        return np.stack([self.line_values(self.material(name), isotopes, energy) for name in materials])
+
+    def calculate(self, isotopes, activities, distances, materials, thicknesses, dose_type='Ambient'):
+        isotopes, activities, distances, materials, thicknesses = np.broadcast_arrays(
+            np.asarray(isotopes, dtype=object), np.asarray(activities, dtype=float), np.asarray(distances, dtype=float),
+            np.asarray(materials, dtype=object), np.asarray(thicknesses, dtype=float))
+
+        isotope_names, isotope_index = np.unique(isotopes.astype(str), return_inverse=True)
+        material_names, material_index = np.unique(materials.astype(str), return_inverse=True)
+        isotope_index = isotope_index.reshape(isotopes.shape)
+        material_index = material_index.reshape(materials.shape)
+
+        energy_table, yield_table = self.line_table(isotope_names)
+        air_table = self.line_values(self.material('Air'), isotope_names, energy_table)
+        material_table = self.material_values(material_names, isotope_names, energy_table)
+        kerma_table = self.line_values(self.dose_type('Kerma'), isotope_names, energy_table) * 3600
+        h10_table = self.line_values(self.dose_type(dose_type), isotope_names, energy_table)
+
+        energy = energy_table[isotope_index]
+        yields = yield_table[isotope_index]
+        shield_values = np.exp(-thicknesses[..., None] * material_table[material_index, isotope_index])
+        air_values = np.exp(-distances[..., None] * air_table[isotope_index])
+        s_a = np.arcsin(np.sin(0.5 / distances) ** 2) / np.pi
+
+        flux = (yields / 100) * activities[..., None] * s_a[..., None] * shield_values * air_values
+        kerma_rate = kerma_table[isotope_index] * flux
+        dose_rate = kerma_rate * h10_table[isotope_index]
+        return BatchResult(energy, yields, flux, kerma_rate, dose_rate)
+
+    def grid(self, isotopes, activities, distances, materials, thicknesses, dose_type='Ambient'):
+        isotopes = np.asarray(isotopes, dtype=object).reshape(-1, 1, 1, 1)
+        activities = np.asarray(activities, dtype=float).reshape(-1, 1, 1, 1)
+        distances = np.asarray(distances, dtype=float).reshape(1, -1, 1, 1)
+        materials = np.asarray(materials, dtype=object).reshape(1, 1, -1, 1)
+        thicknesses = np.asarray(thicknesses, dtype=float).reshape(1, 1, 1, -1)
+        return self.calculate(isotopes, activities, distances, materials, thicknesses, dose_type)
@@ -1,20 +1,30 @@
 import numpy as np
-from scipy import interpolate
 from datetime import *
 import sqlite3 as sq
-import pandas as pd
+import warnings
+from snapshot import load_snapshot
+from storage import SCHEMA_VERSION, ConnectionPool, schema_version
+from decay import decay_days
+from inventory import SourceInventory
 
 
 class Source:
+    __slots__ = ('_name', '_number', '_serial', '_prod_date', '_cur_date', '_original_activity', '_halflife',
+                 '_lines', '_distance', '_current_activity', '_flux', '_kerma_rate', '_dose_rate')
+
     def __init__(self, database, number, cur_date, distance):
-        self._name = database.sources.Isotope[number]
+        inventory = database.inventory
+        isotope = inventory.isotope_index[number]
+        if isotope < 0:
+            raise KeyError(f'no half-life for source {number}')
+        self._name = str(inventory.isotopes[isotope])
         self._number = number
-        self._serial = str(database.sources.SourceNumber[number])
-        self._prod_date = database.sources.ProductionDate[number]
+        self._serial = str(inventory.serials[number])
+        self._prod_date = str(inventory.prod_dates[number])
         self._cur_date = cur_date
-        self._original_activity = round(database.sources.OriginalActivity_Bq[number])
-        self._halflife = database.halflife.Half_life_d[database.halflife.Isotope == self._name].values[0]
-        self._lines = database.read('Lines', self._name)
+        self._original_activity = int(inventory.original_activities[number])
+        self._halflife = inventory.halflife_of(self._name)
+        self._lines = inventory.lines_of(self._name)
         self._distance = distance
         self._current_activity = 0
         self.decay()
@@ -111,16 +121,12 @@ class Source:
         self._current_activity = value
 
     def decay(self):
-        p_d = datetime.strptime(self._prod_date, '%m/%d/%Y')
-        c_d = datetime.strptime(self._cur_date, '%m/%d/%Y')
-        delta = c_d - p_d
-        decay_time = delta.days
+        decay_time = decay_days(self._prod_date, self._cur_date)
         current_activity = round(self._original_activity * np.exp(-(0.693 / self._halflife) * decay_time))
         self._current_activity = current_activity
 
     def line_kerma_rate(self, dose_type):
-        kerma_interpolated = interpolate.interp1d(dose_type.kerma_coeffs[:, 0], dose_type.kerma_coeffs[:, 1], fill_value='extrapolate')
-        kerma_value = kerma_interpolated(self._lines[:, 0]) * 3600
+        kerma_value = registry.values(dose_type.kerma_coeffs, self._lines[:, 0]) * 3600
         kerma_rate = kerma_value * self._flux
         self._kerma_rate = kerma_rate
 
@@ -132,8 +138,7 @@ class Source:
                # attenuation(att_coeff_material, energy, thickness_cm)
 
     def line_dose_rate(self, dose_type):
-        h10_interpolated = interpolate.interp1d(dose_type.coefficients[:, 0], dose_type.coefficients[:, 1], fill_value='extrapolate')
-        d_r = self._kerma_rate * h10_interpolated(self._lines[:, 0])
+        d_r = self._kerma_rate * registry.values(dose_type.coefficients, self._lines[:, 0])
         self._dose_rate = d_r
 
 class DoseType:
@@ -199,19 +204,139 @@ class Shield:
         self._material = value
 
     def attenuation(self, energy):
-        attenuation_interpolated = interpolate.interp1d(self._coefficients[:, 0], self._coefficients[:, 1],
-                                                        fill_value='extrapolate')
-        attenuation_values = np.exp(-self._thickness * attenuation_interpolated(energy))
+        attenuation_values = np.exp(-self._thickness * registry.values(self._coefficients, energy))
         self._attenuation_values = attenuation_values
 
 
+class Interpolator:
+    def __init__(self, coefficients):
+        self._x = np.array(coefficients[:, 0], dtype=float)
+        self._y = np.array(coefficients[:, 1], dtype=float)
+        order = np.argsort(self._x, kind='mergesort')
+        self._x = self._x[order]
+        self._y = self._y[order]
+        self._slope = (self._y[1:] - self._y[:-1]) / (self._x[1:] - self._x[:-1])
+
+    @property
+    def x(self):
+        return self._x
+
+    @property
+    def y(self):
+        return self._y
+
+    def __call__(self, energy):
+        # same linear interpolation and extrapolation as interp1d(..., fill_value='extrapolate')
+        energy = np.asarray(energy, dtype=float)
+        lo = np.searchsorted(self._x, energy).clip(1, len(self._x) - 1) - 1
+        return self._slope[lo] * (energy - self._x[lo]) + self._y[lo]
+
+
+class CoefficientRegistry:
+    def __init__(self):
+        self._tables = {}
+        self._interpolators = {}
+        self._values = {}
+
+    @property
+    def interpolators_built(self):
+        return len(self._interpolators)
+
+    def table(self, database, table, name):
+        key = (database.name, table, name)
+        if key not in self._tables:
+            coefficients = database.read(table, name)
+            coefficients.flags.writeable = False
+            self._tables[key] = coefficients
+        return self._tables[key]
+
+    def interpolator(self, coefficients):
+        key = (coefficients.shape, coefficients.tobytes())
+        interpolator = self._interpolators.get(key)
+        if interpolator is None:
+            interpolator = Interpolator(coefficients)
+            self._interpolators[key] = interpolator
+        return interpolator
+
+    def values(self, coefficients, energy):
+        energy = np.asarray(energy, dtype=float)
+        key = (coefficients.shape, coefficients.tobytes(), energy.shape, energy.tobytes())
+        values = self._values.get(key)
+        if values is None:
+            values = self.interpolator(coefficients)(energy)
+            values.flags.writeable = False
+            self._values[key] = values
+        return values
+
+    def clear(self):
+        self._tables.clear()
+        self._interpolators.clear()
+        self._values.clear()
+
+
+registry = CoefficientRegistry()
+
+
+class Table:
+    def __init__(self, columns):
+        self._columns = columns
+
+    @property
+    def columns(self):
+        return list(self._columns)
+
+    def __getattr__(self, name):
+        try:
+            return self.__dict__['_columns'][name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __len__(self):
+        return len(next(iter(self._columns.values())))
+
+
 class Database:
-    def __init__(self, name):
+    def __init__(self, name, snapshot=False):
         self._name = name
-        con = sq.connect(self._name)
-        self._cur = con.cursor()
-        self._sources = self.read('Sources', '')
-        self._halflife = self.read('Halflife', '')
+        self._snapshot = None
+        self._pool = None
+        self._inventory = None
+        if snapshot:
+            self._snapshot = load_snapshot(self._name)
+            self._sources = Table({'Number': self._snapshot.source_id,
+                                   'Isotope': self._snapshot.source_name,
+                                   'SourceNumber': self._snapshot.source_serial,
+                                   'ProductionDate': self._snapshot.source_prod_date,
+                                   'OriginalActivity_Bq': self._snapshot.source_activity})
+            self._halflife = Table({'Isotope': self._snapshot.isotopes,
+                                    'Half_life_d': self._snapshot.halflife})
+            self._chains = Table({'Parent': self._snapshot.chain_parent, 'Daughter': self._snapshot.chain_daughter,
+                                  'Branching': self._snapshot.chain_branching})
+        else:
+            # opening never writes the database, the schema is upgraded only by cli.py migrate
+            version = schema_version(self._name)
+            if version < SCHEMA_VERSION:
+                warnings.warn(f'{self._name} has schema version {version} of {SCHEMA_VERSION}, '
+                              'run "python cli.py migrate" to upgrade it', stacklevel=2)
+            self._pool = ConnectionPool(self._name)
+            self._sources = self.read('Sources', '')
+            self._halflife = self.read('Halflife', '')
+            self._chains = self.read('DecayChains', '')
+        self._halflife_index = dict(zip(self._halflife.Isotope.tolist(), self._halflife.Half_life_d.tolist()))
+
+    @property
+    def name(self):
+        return self._name
+
+    @property
+    def snapshot(self):
+        return self._snapshot
+
+    @property
+    def materials(self):
+        if self._snapshot is not None:
+            return self._snapshot.materials.tolist()
+        return [column for column in self._pool.columns('Materials') if column != 'Energy']
 
     @property
     def sources(self):
@@ -221,24 +346,70 @@ class Database:
     def halflife(self):
         return self._halflife
 
+    @property
+    def chains(self):
+        return self._chains
+
+    @property
+    def pool(self):
+        return self._pool
+
+    @property
+    def inventory(self):
+        if self._inventory is None:
+            if self._snapshot is not None:
+                self._inventory = SourceInventory.from_snapshot(self._snapshot)
+            else:
+                self._inventory = SourceInventory.from_database(self)
+        return self._inventory
+
+    def halflife_of(self, name):
+        return self._halflife_index[name]
+
+    def write(self, table, columns, rows, replace=False, progress=None):
+        count = self._pool.insert_rows(table, columns, rows, replace, progress=progress)
+        self._inventory = None
+        if table in ('Sources', 'Halflife'):
+            self._sources = self.read('Sources', '')
+            self._halflife = self.read('Halflife', '')
+            self._halflife_index = dict(zip(self._halflife.Isotope.tolist(), self._halflife.Half_life_d.tolist()))
+        elif table == 'DecayChains':
+            self._chains = self.read('DecayChains', '')
+        return count
+
     def read(self, table, name):
+        if self._snapshot is not None:
+            return self._snapshot.read(table, name)
         data = np.zeros(5)
         if table in ['DoseConversionCoefficients', 'Materials']:
-            res = self._cur.execute(f"select energy, {name} from {table} where {name} is not null order by energy asc")
+            column = self._pool.column(table, name)
+            res = self._pool.execute(f'select Energy, {column} from {table} where {column} is not null order by Energy asc')
             data = res.fetchall()
             data = np.array(data)
         elif table == 'Sources':
-            res = self._cur.execute(f"select * from {table} order by id asc")
+            import pandas as pd
+            res = self._pool.execute('select * from Sources order by id asc')
             data = res.fetchall()
             data = pd.DataFrame(data)
             data.columns = ['Number', 'Isotope', 'SourceNumber', 'ProductionDate', 'OriginalActivity_Bq']
         elif table == 'Halflife':
-            res = self._cur.execute(f"select * from {table} order by Isotope asc")
+            import pandas as pd
+            res = self._pool.execute('select * from Halflife order by Isotope asc')
             data = res.fetchall()
             data = pd.DataFrame(data)
             data.columns = ['Isotope', 'Half_life_d']
+        elif table == 'DecayChains':
+            try:
+                data = self._pool.execute('select Parent, Daughter, Branching from DecayChains '
+                                          'order by Parent, Daughter').fetchall()
+            except sq.OperationalError:
+                # database that has not been migrated has no chains
+                data = []
+            data = Table({'Parent': np.array([row[0] for row in data], dtype=str),
+                          'Daughter': np.array([row[1] for row in data], dtype=str),
+                          'Branching': np.array([row[2] for row in data], dtype=float)})
         elif table == 'Lines':
-            res = self._cur.execute(f"select energy, yield from {table} where isotope = '{name}' order by energy asc")
+            res = self._pool.execute('select Energy, Yield from Lines where Isotope = ? order by Energy asc', (name,))
             data = res.fetchall()
             data = np.array(data)
         return data
@@ -0,0 +1,276 @@
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import numpy as np
+from beckend import Database, Source, Shield, DoseType, Interpolator, registry
+from batch import BatchEngine
+from cache import ResultCache
+from geometry import Cylinder, GeometryCalculator
+from pipeline import Pipeline
+from snapshot import load_snapshot
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DB_NAME = os.path.join(HERE, 'DoseCalculator_DB.db')
+BASELINE = os.path.join(HERE, 'benchmark_baseline.json')
+MATERIALS = ['Air', 'Iron', 'Lead', 'Aluminium', 'Copper', 'Tin', 'PMMA']
+CUR_DATE = '01/01/2025'
+
+
+def timer(func, repeat, min_time=0.05):
+    func()
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time or number >= 1e6:
+            break
+        number *= 10
+    times = [elapsed / number]
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        times.append((time.perf_counter() - start) / number)
+    return {'min': min(times), 'median': float(np.median(times)), 'number': number, 'repeat': repeat}
+
+
+def scenarios(isotopes, n=100000):
+    rng = np.random.default_rng(20240101)
+    unique = (rng.choice(isotopes, n), rng.uniform(1e3, 1e10, n), rng.uniform(1, 1000, n), rng.choice(MATERIALS, n),
+              rng.uniform(0, 5, n))
+    repeated = (rng.choice(isotopes, n), rng.uniform(1e3, 1e10, n), rng.choice([10., 50., 100.], n),
+                rng.choice(MATERIALS, n), rng.choice([0., 1., 2.], n))
+    return unique, repeated
+
+
+class Fixtures:
+    def __init__(self):
+        self._db = Database(DB_NAME)
+        self._snapshot_db = Database(DB_NAME, snapshot=True)
+        self._source = Source(self._snapshot_db, 0, CUR_DATE, 10)
+        self._air = Shield('Air', 10, registry.table(self._snapshot_db, 'Materials', 'Air'))
+        self._shield = Shield('Lead', 1, registry.table(self._snapshot_db, 'Materials', 'Lead'))
+        self._dose_type = DoseType('Ambient', registry.table(self._snapshot_db, 'DoseConversionCoefficients', 'Ambient'),
+                                   registry.table(self._snapshot_db, 'DoseConversionCoefficients', 'Kerma'))
+        self._pipeline = Pipeline(self._source, self._shield, self._air, self._dose_type)
+        self._isotopes = self._db.halflife.Isotope.tolist()
+        self._switch = 0
+        self._engine = BatchEngine(load_snapshot(DB_NAME))
+        self._cache = ResultCache()
+        self._geometry = GeometryCalculator(self._engine)
+        self._cylinder = Cylinder(3, 10)
+        self._batch, self._repeated = scenarios(self._isotopes)
+
+    def results_update(self):
+        self._shield.attenuation(self._source.lines[:, 0])
+        self._air.attenuation(self._source.lines[:, 0])
+        self._source.line_flux(self._shield, self._air)
+        self._source.line_kerma_rate(self._dose_type)
+        self._source.line_dose_rate(self._dose_type)
+
+    def pipeline_full(self):
+        # a cold result cache, otherwise only the lookup of the previous run would be timed
+        self._pipeline.cache.clear()
+        self._pipeline.invalidate('lines', 'activity', 'distance', 'shield', 'dose_type')
+        self._pipeline.update()
+
+    def pipeline_activity(self):
+        self._pipeline.invalidate('activity')
+        self._pipeline.update()
+
+    def pipeline_distance(self):
+        self._pipeline.invalidate('distance')
+        self._pipeline.update()
+
+    def isotope_switch(self):
+        name = self._isotopes[self._switch % len(self._isotopes)]
+        self._switch += 1
+        self._source.name = name
+        self._source.halflife = self._snapshot_db.halflife_of(name)
+        self._source.lines = self._snapshot_db.read('Lines', name)
+        self._source.decay()
+        self._pipeline.invalidate('lines', 'activity')
+        self._pipeline.update()
+
+    def batch(self):
+        self._engine.calculate(*self._batch)
+
+    def batch_cached(self):
+        # a cold cache per run, as in one batch job; same inputs as batch_100k
+        self._cache.clear()
+        self._cache.calculate(self._engine, *self._batch)
+
+    def batch_repeated(self):
+        self._engine.calculate(*self._repeated)
+
+    def batch_repeated_cached(self):
+        self._cache.clear()
+        self._cache.calculate(self._engine, *self._repeated)
+
+    def geometry_cylinder(self):
+        self._geometry.calculate('Eu-152', 1e9, self._cylinder, 30., 'Lead', 1., source_material='Iron')
+
+    def cases(self):
+        cases = {
+            'results_update': self.results_update,
+            'pipeline_full': self.pipeline_full,
+            'pipeline_activity': self.pipeline_activity,
+            'pipeline_distance': self.pipeline_distance,
+            'isotope_switch': self.isotope_switch,
+            'db_read_sources': lambda: self._db.read('Sources', ''),
+            'db_read_halflife': lambda: self._db.read('Halflife', ''),
+            'db_read_lines': lambda: self._db.read('Lines', 'Eu-152'),
+            'db_read_materials': lambda: self._db.read('Materials', 'Lead'),
+            'db_read_dose_coefficients': lambda: self._db.read('DoseConversionCoefficients', 'Ambient'),
+            'snapshot_read_lines': lambda: self._snapshot_db.read('Lines', 'Eu-152'),
+            'snapshot_load': lambda: load_snapshot(DB_NAME),
+            'batch_100k': self.batch,
+            'batch_100k_cached': self.batch_cached,
+            'batch_100k_repeated': self.batch_repeated,
+            'batch_100k_repeated_cached': self.batch_repeated_cached,
+            'geometry_cylinder': self.geometry_cylinder,
+        }
+        return cases
+
+
+def run(args):
+    cases = Fixtures().cases()
+    selected = args.only or list(cases)
+    results = {}
+    for name in selected:
+        if name not in cases:
+            print(f"{name:28s} {'unknown':>14s}", file=sys.stderr)
+            continue
+        results[name] = timer(cases[name], args.repeat)
+        if args.label:
+            results[name]['tree'] = args.label
+        print(f"{name:28s} {results[name]['min'] * 1e6:14.2f} us", file=sys.stderr)
+    output = BASELINE if args.save_baseline else args.output
+    if args.merge and output != '-' and os.path.exists(output):
+        with open(output) as f:
+            results = dict(json.load(f)['results'], **results)
+    report = {'python': platform.python_version(), 'numpy': np.__version__, 'machine': platform.machine(),
+              'results': results}
+    if output == '-':
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        with open(output, 'w') as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+def compare(args):
+    with open(args.baseline) as f:
+        baseline = json.load(f)['results']
+    with open(args.results) as f:
+        results = json.load(f)['results']
+    failed = []
+    for name, result in results.items():
+        if name not in baseline:
+            print(f'{name:28s} {"new":>10s}')
+            continue
+        ratio = result['min'] / baseline[name]['min']
+        status = 'ok'
+        if ratio > 1 + args.threshold:
+            status = 'REGRESSION'
+            failed.append(name)
+        print(f"{name:28s} {baseline[name]['min'] * 1e6:14.2f} us {result['min'] * 1e6:14.2f} us {ratio:8.2f}x  {status}")
+    if failed:
+        print(f"{len(failed)} benchmark(s) regressed more than {args.threshold:.0%}: {', '.join(failed)}")
+        return 1
+    return 0
+
+
+def check_values(name, result, expected, rtol):
+    result, expected = np.asarray(result, dtype=float), np.asarray(expected, dtype=float)
+    if result.shape != expected.shape:
+        print(f"{name:28s} {'shape':>14s} MISMATCH")
+        return False
+    ok = np.allclose(result, expected, rtol=rtol, atol=0.)
+    error = np.max(np.abs(result - expected) / np.maximum(np.abs(expected), np.finfo(float).tiny))
+    print(f"{name:28s} {error:14.2e} {'ok' if ok else 'MISMATCH'}")
+    return ok
+
+
+def check(args):
+    # the vectorized paths against the straightforward ones they replaced, exits non-zero on a mismatch
+    results = []
+    # unsorted table: slopes 2 on [1, 2] and 0.5 on [2, 4], the end segments extend past the table
+    interpolator = Interpolator(np.array([[4., 5.], [1., 2.], [2., 4.]]))
+    energy = np.array([0., 1., 1.5, 2., 3., 4., 6.])
+    results.append(check_values('interpolator_known_points', interpolator(energy), [0., 2., 3., 4., 4.5, 5., 6.],
+                                args.rtol))
+    db = Database(args.db)
+    for table, name in [('Materials', args.material), ('DoseConversionCoefficients', 'Kerma')]:
+        coefficients = registry.table(db, table, name)
+        x, y = coefficients[np.argsort(coefficients[:, 0])].T
+        inside = np.linspace(x[0], x[-1], 1001)
+        results.append(check_values(f'interpolator_{name.lower()}', Interpolator(coefficients)(inside),
+                                    np.interp(inside, x, y), args.rtol))
+
+    source = Source(db, int(np.flatnonzero(db.inventory.isotope_index >= 0)[0]), CUR_DATE, args.distance)
+    source.name = args.isotope
+    source.halflife = db.halflife_of(args.isotope)
+    source.lines = db.read('Lines', args.isotope)
+    source.decay()
+    shield = Shield(args.material, args.thickness, registry.table(db, 'Materials', args.material))
+    air = Shield('Air', args.distance, registry.table(db, 'Materials', 'Air'))
+    dose_type = DoseType('Ambient', registry.table(db, 'DoseConversionCoefficients', 'Ambient'),
+                         registry.table(db, 'DoseConversionCoefficients', 'Kerma'))
+    shield.attenuation(source.lines[:, 0])
+    air.attenuation(source.lines[:, 0])
+    source.line_flux(shield, air)
+    source.line_kerma_rate(dose_type)
+    source.line_dose_rate(dose_type)
+    batch = BatchEngine(db).calculate([source.name], source.current_activity, args.distance, args.material,
+                                      args.thickness, 'Ambient')
+    count = len(source.lines)
+    for name in ['flux', 'kerma_rate', 'dose_rate']:
+        results.append(check_values(f'batch_{name}_{source.name}', getattr(batch, name)[0, :count],
+                                    getattr(source, name), args.rtol))
+    if not all(results):
+        print(f'{results.count(False)} check(s) failed')
+        return 1
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmarks of the calculation core')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='time the hot paths and write the results as JSON')
+    run_parser.add_argument('-o', '--output', default='benchmark_results.json')
+    run_parser.add_argument('--repeat', type=int, default=5)
+    run_parser.add_argument('--only', nargs='+', help='run only these benchmarks')
+    run_parser.add_argument('--save-baseline', action='store_true', help=f'write the results to {BASELINE}')
+    run_parser.add_argument('--merge', action='store_true', help='keep the cases of the output file that were not run')
+    run_parser.add_argument('--label', help='tree the results were recorded on, stored with each result')
+    run_parser.set_defaults(func=run)
+
+    compare_parser = commands.add_parser('compare', help='fail when results regress past the baseline')
+    compare_parser.add_argument('results')
+    compare_parser.add_argument('--baseline', default=BASELINE)
+    compare_parser.add_argument('--threshold', type=float, default=0.25, help='allowed slowdown, 0.25 = 25%%')
+    compare_parser.set_defaults(func=compare)
+
+    check_parser = commands.add_parser('check', help='compare the vectorized calculations with the reference ones')
+    check_parser.add_argument('--db', default=DB_NAME)
+    check_parser.add_argument('--isotope', default='Eu-152')
+    check_parser.add_argument('--material', default='Lead')
+    check_parser.add_argument('--thickness', type=float, default=1.)
+    check_parser.add_argument('--distance', type=float, default=50.)
+    check_parser.add_argument('--rtol', type=float, default=1e-9)
+    check_parser.set_defaults(func=check)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
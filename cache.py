@@ -0,0 +1,134 @@
+from collections import OrderedDict
+import numpy as np
+from batch import BatchResult
+
+DEFAULT_SIZE = 65536
+SKIP_RATIO = 0.5
+
+
+class ResultCache:
+    def __init__(self, maxsize=DEFAULT_SIZE):
+        self._maxsize = maxsize
+        self._entries = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    @property
+    def maxsize(self):
+        return self._maxsize
+
+    @property
+    def hits(self):
+        return self._hits
+
+    @property
+    def misses(self):
+        return self._misses
+
+    @property
+    def evictions(self):
+        return self._evictions
+
+    @maxsize.setter
+    def maxsize(self, value):
+        self._maxsize = value
+        self._evict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        lookups = self._hits + self._misses
+        return {'hits': self._hits, 'misses': self._misses, 'evictions': self._evictions,
+                'hit_rate': self._hits / lookups if lookups else 0., 'size': len(self._entries),
+                'maxsize': self._maxsize}
+
+    def clear(self):
+        self._entries.clear()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            self._misses += 1
+            return None
+        self._hits += 1
+        self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key, flux, kerma_rate, dose_rate):
+        entry = np.stack((flux, kerma_rate, dose_rate))
+        entry.flags.writeable = False
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        self._evict()
+        return entry
+
+    def _evict(self):
+        while len(self._entries) > self._maxsize:
+            self._entries.popitem(last=False)
+            self._evictions += 1
+
+    def calculate(self, engine, isotopes, activities, distances, materials, thicknesses, dose_type='Ambient'):
+        isotopes, activities, distances, materials, thicknesses = np.broadcast_arrays(
+            np.atleast_1d(np.asarray(isotopes, dtype=str)), np.asarray(activities, dtype=float),
+            np.asarray(distances, dtype=float), np.asarray(materials, dtype=str), np.asarray(thicknesses, dtype=float))
+        shape = isotopes.shape
+        columns = [np.unique(values.ravel(), return_inverse=True)
+                   for values in (isotopes, materials, distances, thicknesses)]
+        code = np.zeros(isotopes.size, dtype=np.int64)
+        for values, codes in columns:
+            code = code * len(values) + codes.ravel()
+        code, inverse = np.unique(code, return_inverse=True)
+        inverse = inverse.ravel()
+        index = []
+        for values, _ in reversed(columns):
+            index.append(code % len(values))
+            code = code // len(values)
+        name_index, material_index, distance_index, thickness_index = reversed(index)
+        (names, _), (material_names, _), (distance_values, _), (thickness_values, _) = columns
+        if len(name_index) > SKIP_RATIO * isotopes.size:
+            # mostly distinct scenarios, the lookups would cost more than they save
+            return engine.calculate(isotopes, activities, distances, materials, thicknesses, dose_type)
+        keys = list(zip(names[name_index].tolist(), distance_values[distance_index].tolist(),
+                        material_names[material_index].tolist(), thickness_values[thickness_index].tolist(),
+                        [dose_type] * len(name_index)))
+        entries = self._entries
+        found = []
+        for key in keys:
+            entry = entries.get(key)
+            if entry is not None:
+                entries.move_to_end(key)
+            found.append(entry)
+        missing = np.array([i for i, entry in enumerate(found) if entry is None], dtype=np.int64)
+        self._hits += len(keys) - len(missing)
+        self._misses += len(missing)
+
+        energy_table, yield_table = engine.line_table(names.tolist())
+        unit = np.zeros((len(keys), 3, energy_table.shape[1]))
+        for i, entry in enumerate(found):
+            if entry is not None:
+                unit[i, :, :entry.shape[1]] = entry
+        if len(missing):
+            result = engine.calculate(names[name_index[missing]], 1., distance_values[distance_index[missing]],
+                                      material_names[material_index[missing]],
+                                      thickness_values[thickness_index[missing]], dose_type)
+            values = np.stack((result.flux, result.kerma_rate, result.dose_rate), axis=1)
+            unit[missing, :, :values.shape[2]] = values
+            counts = np.array([len(engine.lines(name)) for name in names.tolist()])[name_index[missing]]
+            for i, count, entry in zip(missing.tolist(), counts.tolist(), values):
+                entry = entry[:, :count].copy()
+                entry.flags.writeable = False
+                entries[keys[i]] = entry
+            self._evict()
+
+        unit = unit[inverse] * activities.reshape(-1, 1, 1)
+        flux, kerma_rate, dose_rate = [values.reshape(shape + (-1,)) for values in np.moveaxis(unit, 1, 0)]
+        energy = energy_table[name_index][inverse].reshape(shape + (-1,))
+        yields = yield_table[name_index][inverse].reshape(shape + (-1,))
+        return BatchResult(energy, yields, flux, kerma_rate, dose_rate)
+
+result_cache = ResultCache()
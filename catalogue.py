@@ -0,0 +1,148 @@
+import csv
+import functools
+from datetime import datetime
+from decay import DATE_FORMAT
+from storage import BATCH_SIZE, ConnectionPool, connect, quote
+
+BATCH_ROWS = 10000
+MAX_ERRORS = 20
+COLUMNS = {
+    'Halflife': ['Isotope', 'Halflife_d'],
+    'Lines': ['Isotope', 'Energy', 'Yield'],
+    'Sources': ['id', 'Isotope', 'SourceNumber', 'ProductionDate', 'OriginalActivity'],
+    'DecayChains': ['Parent', 'Daughter', 'Branching'],
+}
+ORDER = ['Halflife', 'Lines', 'Sources', 'DecayChains']
+SORT = {'Halflife': ['Isotope'], 'DecayChains': ['Parent', 'Daughter']}
+# Lines rows have no key of their own, an isotope's lines are replaced as a whole
+KEYS = {'Lines': 'Isotope'}
+
+
+@functools.lru_cache(maxsize=65536)
+def check_date(value):
+    # exactly the format Source.decay parses, e.g. 10/10/2010
+    datetime.strptime(value, DATE_FORMAT)
+    return value
+
+
+def positive(value, name):
+    number = float(value)
+    if not number > 0:
+        raise ValueError(f'{name} must be positive, got {value!r}')
+    return number
+
+
+class CatalogueImport:
+    def __init__(self, db_name, replace=False, strict=False, batch_size=BATCH_ROWS, progress=None):
+        self._pool = ConnectionPool(db_name)
+        self._replace = replace
+        self._strict = strict
+        self._batch_size = batch_size
+        self._progress = progress
+        self._isotopes = {row[0] for row in self._pool.execute('select Isotope from Halflife')}
+        self._lined = {row[0] for row in self._pool.execute('select distinct Isotope from Lines')}
+        self._errors = []
+        self._skipped = 0
+
+    @property
+    def errors(self):
+        return self._errors
+
+    @property
+    def skipped(self):
+        return self._skipped
+
+    @property
+    def isotopes(self):
+        return self._isotopes
+
+    def close(self):
+        self._pool.close()
+
+    def isotope(self, value):
+        if value not in self._isotopes:
+            raise ValueError(f'unknown isotope {value!r}, import its half-life first')
+        return value
+
+    def convert(self, table, row):
+        if table == 'Halflife':
+            isotope = row['Isotope'].strip()
+            if not isotope:
+                raise ValueError('empty isotope')
+            return isotope, positive(row['Halflife_d'], 'Halflife_d')
+        elif table == 'Lines':
+            isotope = self.isotope(row['Isotope'].strip())
+            if isotope in self._lined and not self._replace:
+                raise ValueError(f'{isotope} already has lines, use --replace to replace them')
+            return isotope, positive(row['Energy'], 'Energy'), float(row['Yield'])
+        elif table == 'DecayChains':
+            parent, daughter = self.isotope(row['Parent'].strip()), self.isotope(row['Daughter'].strip())
+            if parent == daughter:
+                raise ValueError(f'{parent} cannot decay into itself')
+            branching = positive(row['Branching'], 'Branching')
+            if branching > 1:
+                raise ValueError(f'Branching must not exceed 1, got {row["Branching"]!r}')
+            return parent, daughter, branching
+        source_id = row.get('id')
+        return (int(source_id) if source_id not in (None, '') else None, self.isotope(row['Isotope'].strip()),
+                row.get('SourceNumber') or None, check_date(row['ProductionDate'].strip()),
+                positive(row['OriginalActivity'], 'OriginalActivity'))
+
+    def rows(self, table, stream):
+        reader = csv.DictReader(stream)
+        missing = [column for column in COLUMNS[table] if column != 'id' and column not in (reader.fieldnames or [])]
+        if missing:
+            raise ValueError(f"{table} CSV lacks column(s) {', '.join(missing)}")
+        for number, row in enumerate(reader, start=2):
+            try:
+                values = self.convert(table, row)
+            except (KeyError, ValueError, TypeError, AttributeError) as e:
+                if self._strict:
+                    raise ValueError(f'{table} line {number}: {e}') from e
+                self._skipped += 1
+                if len(self._errors) < MAX_ERRORS:
+                    self._errors.append(f'{table} line {number}: {e}')
+                continue
+            if table == 'Halflife':
+                self._isotopes.add(values[0])
+            yield values
+
+    def load(self, table, stream):
+        progress = None
+        if self._progress is not None:
+            progress = functools.partial(self._progress, table)
+        return self._pool.insert_rows(table, COLUMNS[table], self.rows(table, stream), self._replace,
+                                      self._batch_size, progress, KEYS.get(table))
+
+
+def export_rows(db_name, table, batch_size=BATCH_SIZE):
+    if table not in COLUMNS:
+        raise KeyError(f'unknown table {table}')
+    con = connect(db_name)
+    try:
+        order = ', '.join(quote(column) for column in SORT.get(table, ['id']))
+        columns = ', '.join(quote(column) for column in COLUMNS[table])
+        cursor = con.execute(f'select {columns} from {quote(table)} order by {order} asc')
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield from rows
+    finally:
+        con.close()
+
+
+def export_csv(db_name, table, stream, batch_size=BATCH_SIZE, progress=None):
+    writer = csv.writer(stream)
+    writer.writerow(COLUMNS[table])
+    count = 0
+    rows = export_rows(db_name, table, batch_size)
+    while True:
+        batch = [row for _, row in zip(range(batch_size), rows)]
+        if not batch:
+            break
+        writer.writerows(batch)
+        count += len(batch)
+        if progress is not None:
+            progress(table, count)
+    return count
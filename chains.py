@@ -0,0 +1,181 @@
+import numpy as np
+from decay import to_datetime64
+
+CHUNK_SIZE = 10000
+
+
+def chain_order(parent, children):
+    # members reachable from the parent, each one after all of its precursors
+    members = [parent]
+    stack = [parent]
+    while stack:
+        for daughter, _ in children.get(stack.pop(), []):
+            if daughter not in members:
+                members.append(daughter)
+                stack.append(daughter)
+    precursors = {member: 0 for member in members}
+    for member in members:
+        for daughter, _ in children.get(member, []):
+            precursors[daughter] += 1
+    order = []
+    ready = [parent] if not precursors[parent] else []
+    while ready:
+        member = ready.pop(0)
+        order.append(member)
+        for daughter, _ in children.get(member, []):
+            precursors[daughter] -= 1
+            if not precursors[daughter]:
+                ready.append(daughter)
+    if len(order) != len(members):
+        raise ValueError(f'decay chain of {parent} has a loop')
+    return order
+
+
+class DecayChain:
+    def __init__(self, nuclides, halflives, branches):
+        self._nuclides = np.asarray(nuclides, dtype=str)
+        self._rates = 0.693 / np.asarray(halflives, dtype=float)
+        size = len(self._nuclides)
+        # dA_d/dt = rate_d * (sum of branching * A_p over precursors - A_d), lower triangular in chain order
+        matrix = np.diag(-self._rates)
+        for parent, daughter, branching in branches:
+            matrix[daughter, parent] += branching * self._rates[daughter]
+        # eigenvectors by forward substitution, the same terms as the Bateman solution
+        vectors = np.eye(size)
+        for k in range(size):
+            for j in range(k + 1, size):
+                gap = self._rates[j] - self._rates[k]
+                if gap == 0:
+                    raise ValueError(f'{self._nuclides[k]} and {self._nuclides[j]} have the same half-life')
+                vectors[j, k] = matrix[j, k:j] @ vectors[k:j, k] / gap
+        self._matrix = matrix
+        # A(t) = V exp(-rates t) V^-1 A(0), with only the parent present at production
+        self._coefficients = vectors * np.linalg.inv(vectors)[:, 0]
+
+    @property
+    def nuclides(self):
+        return self._nuclides
+
+    @property
+    def rates(self):
+        return self._rates
+
+    @property
+    def matrix(self):
+        return self._matrix
+
+    @property
+    def coefficients(self):
+        return self._coefficients
+
+    def activities(self, original_activities, days):
+        # (members,) + days.shape, days may be (sources, dates)
+        days = np.asarray(days, dtype=float)
+        # nothing exists before production, and short-lived modes would overflow on negative days
+        modes = np.exp(-self._rates * np.maximum(days, 0)[..., None])
+        activities = np.tensordot(modes, self._coefficients, axes=([-1], [1]))
+        activities = np.moveaxis(activities, -1, 0) * np.asarray(original_activities, dtype=float)[..., None]
+        return np.where(days >= 0, activities, 0.)
+
+
+class DecayChains:
+    def __init__(self, parents, daughters, branching, halflife_of):
+        self._children = {}
+        for parent, daughter, ratio in zip(np.asarray(parents, dtype=str).tolist(),
+                                           np.asarray(daughters, dtype=str).tolist(),
+                                           np.asarray(branching, dtype=float).tolist()):
+            self._children.setdefault(parent, []).append((daughter, ratio))
+        self._halflife_of = halflife_of
+        self._chains = {}
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        return cls(snapshot.chain_parent, snapshot.chain_daughter, snapshot.chain_branching, snapshot.halflife_of)
+
+    @classmethod
+    def from_database(cls, database):
+        chains = database.chains
+        return cls(chains.Parent, chains.Daughter, chains.Branching, database.halflife_of)
+
+    @property
+    def children(self):
+        return self._children
+
+    def chain(self, parent):
+        chain = self._chains.get(parent)
+        if chain is None:
+            nuclides = chain_order(parent, self._children)
+            index = {nuclide: i for i, nuclide in enumerate(nuclides)}
+            branches = [(index[nuclide], index[daughter], branching)
+                        for nuclide in nuclides for daughter, branching in self._children.get(nuclide, [])]
+            halflives = []
+            for nuclide in nuclides:
+                try:
+                    halflives.append(self._halflife_of(nuclide))
+                except KeyError:
+                    raise KeyError(f'no half-life for {nuclide} in the decay chain of {parent}')
+            chain = self._chains[parent] = DecayChain(nuclides, halflives, branches)
+        return chain
+
+    def members(self, isotopes):
+        # (source index, nuclide) rows in the order expand returns them, without evaluating any activity
+        isotopes = np.atleast_1d(np.asarray(isotopes, dtype=str))
+        names, inverse = np.unique(isotopes, return_inverse=True)
+        nuclides = [self.chain(name).nuclides for name in names.tolist()]
+        sizes = np.array([len(members) for members in nuclides], dtype=np.int64)
+        starts = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+        counts = sizes[inverse]
+        sources = np.repeat(np.arange(len(isotopes)), counts)
+        offsets = np.arange(len(sources)) - np.repeat(np.cumsum(counts) - counts, counts)
+        flat = np.concatenate(nuclides) if nuclides else isotopes
+        return sources, flat[np.repeat(starts[inverse], counts) + offsets]
+
+    def expand(self, isotopes, original_activities, prod_dates, dates):
+        # one row per source and chain member, in source order: (source index, nuclide, activity per date)
+        isotopes = np.atleast_1d(np.asarray(isotopes, dtype=str))
+        original_activities = np.round(np.broadcast_to(np.asarray(original_activities, dtype=float), isotopes.shape))
+        prod_dates = np.broadcast_to(to_datetime64(prod_dates), isotopes.shape)
+        dates = to_datetime64(np.atleast_1d(dates))
+        days = (dates[None, :] - prod_dates[:, None]).astype(np.int64)
+        if not len(isotopes):
+            return np.zeros(0, dtype=np.int64), isotopes, np.zeros((0, len(dates)))
+        names, inverse = np.unique(isotopes, return_inverse=True)
+        sources, nuclides, activities = [], [], []
+        for i, name in enumerate(names):
+            rows = np.flatnonzero(inverse == i)
+            chain = self.chain(name)
+            sources.append(np.tile(rows, len(chain.nuclides)))
+            nuclides.append(np.repeat(chain.nuclides, len(rows)))
+            activities.append(chain.activities(original_activities[rows], days[rows]).reshape(-1, len(dates)))
+        order = np.argsort(np.concatenate(sources), kind='stable')
+        return np.concatenate(sources)[order], np.concatenate(nuclides)[order], \
+            np.round(np.concatenate(activities)[order])
+
+    def evaluate(self, engine, isotopes, original_activities, prod_dates, dates, distances, materials='Air',
+                 thicknesses=0., dose_type='Ambient', chunk_size=CHUNK_SIZE, calculate=None):
+        # daughter lines enter through their own Lines rows, the unit-activity response of every member is
+        # calculated once and scaled by its activity on each date; totals are (3, sources, dates)
+        calculate = calculate or engine.calculate
+        isotopes = np.atleast_1d(np.asarray(isotopes, dtype=str))
+        dates = np.atleast_1d(dates)
+        original_activities, prod_dates, distances, materials, thicknesses = [
+            np.broadcast_to(values, isotopes.shape) for values in (
+                np.asarray(original_activities, dtype=float), np.asarray(prod_dates), np.asarray(distances, dtype=float),
+                np.asarray(materials, dtype=str), np.asarray(thicknesses, dtype=float))]
+        totals = np.zeros((3, len(isotopes), len(dates)))
+        for start in range(0, len(isotopes), chunk_size):
+            rows = slice(start, start + chunk_size)
+            sources, nuclides, activities = self.expand(isotopes[rows], original_activities[rows], prod_dates[rows],
+                                                        dates)
+            sources = sources + start
+            unit = calculate(nuclides, 1., distances[sources], materials[sources], thicknesses[sources], dose_type)
+            for k, values in enumerate((unit.total_flux, unit.total_kerma_rate, unit.total_dose_rate)):
+                np.add.at(totals[k], sources, values[:, None] * activities)
+        return totals
+
+    def evaluate_inventory(self, engine, inventory, dates, distances, materials='Air', thicknesses=0.,
+                           dose_type='Ambient', rows=slice(None), chunk_size=CHUNK_SIZE, calculate=None):
+        inventory.require(rows)
+        return self.evaluate(engine, inventory.names[rows], inventory.original_activities[rows],
+                             inventory.dates[rows], dates, distances, materials, thicknesses, dose_type, chunk_size,
+                             calculate)
@@ -0,0 +1,531 @@
+import os
+import sys
+import csv
+import json
+import time
+import sqlite3
+import argparse
+import functools
+import itertools
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import instrumentation
+from batch import BatchEngine
+from catalogue import ORDER, CatalogueImport, export_csv
+from cache import result_cache
+from chains import DecayChains
+from decay import DecayProjection, DATE_FORMAT, to_datetime64
+from field import FieldMap, catalogue_sources, map_field
+from geometry import GEOMETRIES, GeometryCalculator, Point
+from reconstruct import ActivityReconstruction, measurement_chunks
+from snapshot import load_snapshot
+from storage import SCHEMA_VERSION, migrate, schema_version
+from uncertainty import UncertaintyModel, propagate
+
+DEFAULT_DB = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'DoseCalculator_DB.db')
+TOTAL_FIELDS = ['scenario', 'id', 'isotope', 'activity', 'distance', 'material', 'thickness', 'dose_type',
+                'total_flux', 'total_kerma_rate', 'total_dose_rate', 'error']
+LINE_FIELDS = ['scenario', 'id', 'energy', 'yield', 'flux', 'kerma_rate', 'dose_rate']
+
+_engine = None
+_chains = None
+
+
+def init_engine(db_name, cache_size=None, daughters=False):
+    global _engine, _chains
+    snapshot = load_snapshot(db_name)
+    _engine = BatchEngine(snapshot)
+    _chains = DecayChains.from_snapshot(snapshot) if daughters else None
+    if cache_size is not None:
+        result_cache.maxsize = cache_size
+
+
+def file_format(path, value):
+    if value:
+        return value
+    return 'jsonl' if path.endswith(('.jsonl', '.json', '.ndjson')) else 'csv'
+
+
+def open_stream(path, mode):
+    if path == '-':
+        return sys.stdin if mode == 'r' else sys.stdout
+    return open(path, mode, newline='')
+
+
+def read_scenarios(stream, fmt):
+    if fmt == 'csv':
+        for row in csv.DictReader(stream):
+            yield row
+    else:
+        for line in stream:
+            if line.strip():
+                yield json.loads(line)
+
+
+class Writer:
+    def __init__(self, stream, fmt, fields):
+        self._stream = stream
+        self._fmt = fmt
+        self._fields = fields
+        if fmt == 'csv':
+            self._writer = csv.DictWriter(stream, fieldnames=fields, extrasaction='ignore')
+            self._writer.writeheader()
+
+    def write(self, rows):
+        if self._fmt == 'csv':
+            self._writer.writerows(rows)
+        else:
+            for row in rows:
+                self._stream.write(json.dumps({key: row.get(key) for key in self._fields}) + '\n')
+
+
+def scenario(row):
+    return {'id': row.get('id', ''),
+            'isotope': str(row['isotope']),
+            'activity': float(row['activity']),
+            'distance': float(row['distance']),
+            'material': str(row.get('material') or 'Air'),
+            'thickness': float(row.get('thickness') or 0),
+            'dose_type': str(row.get('dose_type') or 'Ambient')}
+
+
+def calculate_chunk(start, rows, per_line):
+    engine = _engine
+    totals = []
+    lines = []
+    valid = {}
+    for i, row in enumerate(rows):
+        try:
+            item = scenario(row)
+            if not len(engine.lines(item['isotope'])):
+                raise KeyError(item['isotope'])
+            engine.material(item['material'])
+            engine.dose_type(item['dose_type'])
+            if _chains is not None:
+                # activity is the original activity on prod_date, the daughters grow in until date
+                item['prod_date'], item['date'] = str(row['prod_date']), str(row['date'])
+                prod_date, date = to_datetime64([item['prod_date'], item['date']])
+                if date < prod_date:
+                    raise ValueError(f"date {item['date']} is before prod_date {item['prod_date']}")
+                _chains.chain(item['isotope'])
+        except (KeyError, ValueError, TypeError) as e:
+            totals.append({'scenario': start + i, 'id': row.get('id', ''), 'error': f'{type(e).__name__}: {e}'})
+            continue
+        item['scenario'] = start + i
+        totals.append(item)
+        valid.setdefault((item['dose_type'], item.get('date')), []).append(item)
+
+    for (dose_type, date), items in valid.items():
+        calculate = functools.partial(result_cache.calculate, engine) if result_cache.maxsize else engine.calculate
+        if _chains is not None:
+            result = _chains.evaluate(engine, [item['isotope'] for item in items], [item['activity'] for item in items],
+                                      [item['prod_date'] for item in items], [date],
+                                      [item['distance'] for item in items], [item['material'] for item in items],
+                                      [item['thickness'] for item in items], dose_type, calculate=calculate)
+            total_flux, total_kerma_rate, total_dose_rate = [values[:, 0].tolist() for values in result]
+        else:
+            result = calculate([item['isotope'] for item in items], [item['activity'] for item in items],
+                               [item['distance'] for item in items], [item['material'] for item in items],
+                               [item['thickness'] for item in items], dose_type)
+            total_flux = result.total_flux.tolist()
+            total_kerma_rate = result.total_kerma_rate.tolist()
+            total_dose_rate = result.total_dose_rate.tolist()
+        for j, item in enumerate(items):
+            item['total_flux'] = total_flux[j]
+            item['total_kerma_rate'] = total_kerma_rate[j]
+            item['total_dose_rate'] = total_dose_rate[j]
+        if per_line and _chains is None:
+            counts = [len(engine.lines(item['isotope'])) for item in items]
+            mask = np.arange(result.flux.shape[-1]) < np.array(counts)[:, None]
+            columns = [np.repeat([item['scenario'] for item in items], counts).tolist(),
+                       np.repeat(np.array([item['id'] for item in items], dtype=object), counts).tolist()]
+            columns += [values[mask].tolist() for values in (result.energy, result.yields, result.flux,
+                                                             result.kerma_rate, result.dose_rate)]
+            lines.extend(dict(zip(LINE_FIELDS, values)) for values in zip(*columns))
+    if per_line:
+        lines.sort(key=lambda line: line['scenario'])
+    return totals, lines
+
+
+def chunks(rows, size):
+    rows = iter(rows)
+    start = 0
+    while True:
+        chunk = list(itertools.islice(rows, size))
+        if not chunk:
+            return
+        yield start, chunk
+        start += len(chunk)
+
+
+def run_chunks(rows, size, per_line, workers, db_name, cache_size=None, daughters=False):
+    if workers <= 1:
+        init_engine(db_name, cache_size, daughters)
+        for start, chunk in chunks(rows, size):
+            yield calculate_chunk(start, chunk, per_line)
+        return
+    with ProcessPoolExecutor(workers, initializer=init_engine, initargs=(db_name, cache_size, daughters)) as pool:
+        pending = []
+        for start, chunk in chunks(rows, size):
+            pending.append(pool.submit(calculate_chunk, start, chunk, per_line))
+            if len(pending) >= workers * 2:
+                yield pending.pop(0).result()
+        for future in pending:
+            yield future.result()
+
+
+def batch(args):
+    if args.daughters and args.lines_output:
+        print('per-line results are not available with --daughters', file=sys.stderr)
+        return 1
+    input_format = file_format(args.input, args.input_format)
+    output_format = file_format(args.output, args.output_format)
+    source = open_stream(args.input, 'r')
+    target = open_stream(args.output, 'w')
+    line_target = open_stream(args.lines_output, 'w') if args.lines_output else None
+    try:
+        writer = Writer(target, output_format, TOTAL_FIELDS)
+        line_writer = None
+        if line_target is not None:
+            line_writer = Writer(line_target, file_format(args.lines_output, args.output_format), LINE_FIELDS)
+        count = 0
+        for totals, lines in run_chunks(read_scenarios(source, input_format), args.chunk_size,
+                                        line_writer is not None, args.workers, args.db, args.cache_size,
+                                        args.daughters):
+            writer.write(totals)
+            if line_writer is not None:
+                line_writer.write(lines)
+            count += len(totals)
+        print(f'{count} scenarios processed', file=sys.stderr)
+        if args.workers <= 1 and result_cache.maxsize:
+            cache = result_cache.stats()
+            print(f"cache: {cache['hits']} hits, {cache['misses']} misses, {cache['evictions']} evictions",
+                  file=sys.stderr)
+    finally:
+        for stream in (source, target, line_target):
+            if stream is not None and stream not in (sys.stdin, sys.stdout):
+                stream.close()
+
+
+def decay(args):
+    target = open_stream(args.output, 'w')
+    try:
+        snapshot = load_snapshot(args.db)
+        chains = DecayChains.from_snapshot(snapshot) if args.daughters else None
+        projection = DecayProjection(snapshot, chains)
+        count = projection.export(target, args.start, args.stop, args.step, args.chunk_size)
+        print(f'{count} dates exported', file=sys.stderr)
+        if len(projection.skipped):
+            print(f"source(s) {', '.join(str(number) for number in projection.skipped)} skipped, no half-life",
+                  file=sys.stderr)
+    finally:
+        if target is not sys.stdout:
+            target.close()
+
+
+def field(args):
+    snapshot = load_snapshot(args.db)
+    with open_stream(args.sources, 'r') as stream:
+        rows = list(read_scenarios(stream, file_format(args.sources, None)))
+    isotopes = []
+    activities = []
+    for row in rows:
+        if row.get('source') not in (None, ''):
+            try:
+                isotope, activity = catalogue_sources(snapshot, [int(row['source'])], args.date)
+            except KeyError as e:
+                print(e.args[0], file=sys.stderr)
+                return 1
+            isotopes.append(isotope[0])
+            activities.append(activity[0])
+        else:
+            isotopes.append(row['isotope'])
+            activities.append(float(row['activity']))
+    field_map = FieldMap(BatchEngine(snapshot), isotopes, activities,
+                         [[float(row['x']), float(row['y']), float(row['z'])] for row in rows],
+                         [row.get('material') or 'Air' for row in rows],
+                         [float(row.get('thickness') or 0) for row in rows], args.dose_type, args.min_distance)
+    axes = [np.linspace(*axis[:2], int(axis[2])) for axis in (args.x, args.y, args.z) if axis is not None]
+    map_field(field_map, axes, args.output, args.chunk_size, args.workers,
+              lambda done, total: print(f'\r{done}/{total} points', end='', file=sys.stderr))
+    print(file=sys.stderr)
+
+
+def geometry(args):
+    engine = BatchEngine(load_snapshot(args.db))
+    options = {'order': args.order} if args.order else {}
+    if args.kind in ('line', 'disk', 'cylinder') and args.axis:
+        options['axis'] = args.axis
+    try:
+        shape = GEOMETRIES[args.kind](*args.dimensions, **options)
+    except TypeError:
+        print(f'wrong number of dimensions for {args.kind}', file=sys.stderr)
+        return 1
+    calculator = GeometryCalculator(engine)
+    result = calculator.calculate(args.isotope, args.activity, shape, args.distances, args.material, args.thickness,
+                                  args.dose_type, args.source_material, args.offset)
+    point = calculator.calculate(args.isotope, args.activity, Point(), args.distances, args.material, args.thickness,
+                                 args.dose_type, offsets=args.offset)
+    writer = csv.writer(sys.stdout)
+    writer.writerow(['distance', 'total_flux', 'total_kerma_rate', 'total_dose_rate', 'point_dose_rate'])
+    for row in zip(args.distances, result.total_flux, result.total_kerma_rate, result.total_dose_rate,
+                   point.total_dose_rate):
+        writer.writerow(row)
+
+
+def reconstruct(args):
+    if args.residuals and args.readings == '-':
+        print('--residuals reads the log twice and needs a file', file=sys.stderr)
+        return 1
+    snapshot = load_snapshot(args.db)
+    with open_stream(args.sources, 'r') as stream:
+        rows = list(read_scenarios(stream, file_format(args.sources, None)))
+    isotopes = []
+    expected = []
+    for row in rows:
+        if row.get('source') not in (None, ''):
+            try:
+                isotope, activity = catalogue_sources(snapshot, [int(row['source'])], args.date)
+            except KeyError as e:
+                print(e.args[0], file=sys.stderr)
+                return 1
+            isotopes.append(isotope[0])
+            expected.append(activity[0])
+        else:
+            isotopes.append(row['isotope'])
+            expected.append('')
+    positions = [[float(row['x']), float(row['y']), float(row['z'])] for row in rows]
+    engine = BatchEngine(snapshot)
+    model = ActivityReconstruction(engine, isotopes, positions, args.dose_type, args.min_distance)
+    fmt = file_format(args.readings, args.input_format)
+    with open_stream(args.readings, 'r') as stream:
+        model.add_chunks(measurement_chunks(read_scenarios(stream, fmt), args.chunk_size, args.relative_error),
+                         lambda count: print(f'\r{count} readings', end='', file=sys.stderr))
+    print(file=sys.stderr)
+    result = model.solve()
+
+    target = open_stream(args.output, 'w')
+    try:
+        writer = csv.writer(target)
+        writer.writerow(['isotope', 'x', 'y', 'z', 'activity', 'std', 'catalogue_activity'])
+        for isotope, position, activity, std, catalogue in zip(isotopes, positions, result.activities, result.std,
+                                                                expected):
+            writer.writerow([isotope] + position + [activity, std, catalogue])
+    finally:
+        if target is not sys.stdout:
+            target.close()
+    print(f'{result.count} readings, chi2 {result.chi2:.6g}, reduced chi2 {result.reduced_chi2:.6g}, '
+          f'weighted rms {result.rms:.6g}', file=sys.stderr)
+
+    if args.residuals:
+        with open_stream(args.readings, 'r') as stream, open_stream(args.residuals, 'w') as out:
+            writer = csv.writer(out)
+            writer.writerow(['x', 'y', 'z', 'dose_rate', 'predicted', 'residual'])
+            for points, materials, thicknesses, dose_rates, _ in measurement_chunks(read_scenarios(stream, fmt),
+                                                                                   args.chunk_size):
+                predicted, residual = model.residuals(result.activities, points, materials, thicknesses, dose_rates)
+                writer.writerows(np.column_stack((points, dose_rates, predicted, residual)).tolist())
+
+
+def uncertainty(args):
+    engine = BatchEngine(load_snapshot(args.db))
+    model = UncertaintyModel(engine, args.isotope, args.activity, args.prod_date, args.date, args.distance,
+                             args.material, args.thickness, args.dose_type, args.activity_rsd, args.prod_date_sd,
+                             args.distance_sd, args.thickness_sd)
+    stats = propagate(model, args.samples, args.seed, args.chunk_size, args.workers,
+                      lambda done, total: print(f'\r{done}/{total} samples', end='', file=sys.stderr))
+    print(file=sys.stderr)
+    nominal = dict(zip(stats, model.nominal()))
+    json.dump({name: dict(nominal=nominal[name], **stat.summary(args.percentiles)) for name, stat in stats.items()},
+              sys.stdout, indent=2)
+    print()
+
+
+_last_report = [0.]
+
+
+def report_progress(table, count):
+    now = time.monotonic()
+    if now - _last_report[0] >= 0.5:
+        _last_report[0] = now
+        print(f'\r{table}: {count} rows', end='', file=sys.stderr)
+
+
+def import_catalogue(args):
+    version = schema_version(args.db)
+    if version < SCHEMA_VERSION:
+        print(f'{args.db} has schema version {version} of {SCHEMA_VERSION}, run "python cli.py migrate" first',
+              file=sys.stderr)
+        return 1
+    files = {'Halflife': args.halflife, 'Lines': args.lines, 'Sources': args.sources, 'DecayChains': args.chains}
+    loader = CatalogueImport(args.db, args.replace, args.strict, args.batch_size, report_progress)
+    try:
+        for table in ORDER:
+            if files[table] is None:
+                continue
+            try:
+                with open_stream(files[table], 'r') as stream:
+                    count = loader.load(table, stream)
+            except (ValueError, sqlite3.IntegrityError) as e:
+                print(f'\n{e}, {table} rolled back', file=sys.stderr)
+                return 1
+            print(f'\r{table}: {count} rows imported', file=sys.stderr)
+    finally:
+        loader.close()
+    for error in loader.errors:
+        print(error, file=sys.stderr)
+    if loader.skipped:
+        print(f'{loader.skipped} invalid rows skipped', file=sys.stderr)
+        return 1
+    return 0
+
+
+def export_catalogue(args):
+    target = open_stream(args.output, 'w')
+    try:
+        count = export_csv(args.db, args.table, target, progress=report_progress if args.output != '-' else None)
+    finally:
+        if target is not sys.stdout:
+            target.close()
+    print(f'\r{args.table}: {count} rows exported', file=sys.stderr)
+
+
+def upgrade(args):
+    print(f'schema version {migrate(args.db)}', file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='cli.py', description='Headless gamma dose-rate and flux calculator')
+    parser.add_argument('--db', default=DEFAULT_DB, help='SQLite database with nuclear data')
+    parser.add_argument('--profile', metavar='REPORT', help='write stage timers and counters to a JSON or CSV file')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    batch_parser = commands.add_parser('batch', help='calculate scenarios from a CSV or JSON Lines file')
+    batch_parser.add_argument('input', help="scenario file ('-' for stdin) with columns isotope, activity, distance "
+                                            "and optional id, material, thickness, dose_type")
+    batch_parser.add_argument('-o', '--output', default='-', help="total results file ('-' for stdout)")
+    batch_parser.add_argument('--lines-output', help='per-line results file')
+    batch_parser.add_argument('--input-format', choices=['csv', 'jsonl'])
+    batch_parser.add_argument('--output-format', choices=['csv', 'jsonl'])
+    batch_parser.add_argument('--chunk-size', type=int, default=10000)
+    batch_parser.add_argument('--workers', type=int, default=1)
+    batch_parser.add_argument('--cache-size', type=int, default=0,
+                              help='unit-activity results kept per process for inputs that repeat geometries, '
+                                   '0 disables the cache (default 0)')
+    batch_parser.add_argument('--daughters', action='store_true',
+                              help='add the daughters of the DecayChains table grown in between the prod_date and '
+                                   'date columns (mm/dd/yyyy), activity is then the activity on prod_date')
+    batch_parser.set_defaults(func=batch)
+
+    decay_parser = commands.add_parser('decay', help='project current activity of every catalogue source')
+    decay_parser.add_argument('start', help='first date, mm/dd/yyyy')
+    decay_parser.add_argument('stop', help='last date, mm/dd/yyyy')
+    decay_parser.add_argument('--step', choices=['D', 'W', 'M'], default='D', help='day, week or month')
+    decay_parser.add_argument('-o', '--output', default='-', help="CSV file ('-' for stdout)")
+    decay_parser.add_argument('--daughters', action='store_true',
+                              help='add a column per daughter of the DecayChains table')
+    decay_parser.add_argument('--chunk-size', type=int, help='dates per chunk (default: sized to the catalogue)')
+    decay_parser.set_defaults(func=decay)
+
+    field_parser = commands.add_parser('field', help='map total dose rate and flux of several sources on a grid')
+    field_parser.add_argument('sources', help='CSV or JSON Lines with x, y, z in cm and either a catalogue source id '
+                                              'or isotope and activity; optional material, thickness')
+    field_parser.add_argument('--x', nargs=3, type=float, required=True, metavar=('START', 'STOP', 'N'))
+    field_parser.add_argument('--y', nargs=3, type=float, required=True, metavar=('START', 'STOP', 'N'))
+    field_parser.add_argument('--z', nargs=3, type=float, metavar=('START', 'STOP', 'N'))
+    field_parser.add_argument('--date', default=datetime.now().strftime(DATE_FORMAT),
+                              help='date for catalogue source activities, mm/dd/yyyy')
+    field_parser.add_argument('--dose-type', default='Ambient', choices=['Ambient', 'Personal'])
+    field_parser.add_argument('--min-distance', type=float, default=1.)
+    field_parser.add_argument('-o', '--output', default='field.npy',
+                              help='.npy file holding [dose rate, flux] x grid shape')
+    field_parser.add_argument('--chunk-size', type=int)
+    field_parser.add_argument('--workers', type=int, default=1)
+    field_parser.set_defaults(func=field)
+
+    geometry_parser = commands.add_parser('geometry', help='dose rate of a line, disk, cylinder or box source')
+    geometry_parser.add_argument('isotope')
+    geometry_parser.add_argument('activity', type=float, help='total activity, Bq')
+    geometry_parser.add_argument('kind', choices=list(GEOMETRIES))
+    geometry_parser.add_argument('dimensions', type=float, nargs='*',
+                                 help='cm: line length, disk radius, cylinder radius and height, box x y z')
+    geometry_parser.add_argument('--distances', type=float, nargs='+', default=[100.],
+                                 help='cm from the source centre along z')
+    geometry_parser.add_argument('--offset', type=float, default=0., help='detector offset along x, cm')
+    geometry_parser.add_argument('--axis', choices=['x', 'y', 'z'], help='line, disk normal or cylinder axis')
+    geometry_parser.add_argument('--source-material', help='Materials column for self-attenuation of volume sources')
+    geometry_parser.add_argument('--material', default='Air')
+    geometry_parser.add_argument('--thickness', type=float, default=0., help='cm')
+    geometry_parser.add_argument('--dose-type', default='Ambient', choices=['Ambient', 'Personal'])
+    geometry_parser.add_argument('--order', type=int, help='quadrature points per dimension, raise close to the source')
+    geometry_parser.set_defaults(func=geometry)
+
+    reconstruct_parser = commands.add_parser('reconstruct', help='estimate source activities from dose-rate readings')
+    reconstruct_parser.add_argument('sources', help='CSV or JSON Lines with x, y, z in cm and either a catalogue '
+                                                    'source id or an isotope for every candidate source')
+    reconstruct_parser.add_argument('readings', help="survey log ('-' for stdin) with x, y, z in cm, dose_rate in "
+                                                     "uSv/h and optional material, thickness, uncertainty")
+    reconstruct_parser.add_argument('-o', '--output', default='-', help="activities CSV ('-' for stdout)")
+    reconstruct_parser.add_argument('--residuals', help='CSV with predicted dose rate and residual per reading')
+    reconstruct_parser.add_argument('--input-format', choices=['csv', 'jsonl'])
+    reconstruct_parser.add_argument('--relative-error', type=float,
+                                    help='weight readings without uncertainty by this fraction of their value')
+    reconstruct_parser.add_argument('--date', default=datetime.now().strftime(DATE_FORMAT),
+                                    help='date for catalogue activities shown for comparison, mm/dd/yyyy')
+    reconstruct_parser.add_argument('--dose-type', default='Ambient', choices=['Ambient', 'Personal'])
+    reconstruct_parser.add_argument('--min-distance', type=float, default=1.)
+    reconstruct_parser.add_argument('--chunk-size', type=int, default=10000)
+    reconstruct_parser.set_defaults(func=reconstruct)
+
+    uncertainty_parser = commands.add_parser('uncertainty', help='Monte Carlo spread of flux, kerma and dose rate')
+    uncertainty_parser.add_argument('isotope')
+    uncertainty_parser.add_argument('activity', type=float, help='certified activity, Bq')
+    uncertainty_parser.add_argument('prod_date', help='certificate date, mm/dd/yyyy')
+    uncertainty_parser.add_argument('distance', type=float, help='cm')
+    uncertainty_parser.add_argument('--date', default=datetime.now().strftime(DATE_FORMAT), help='mm/dd/yyyy')
+    uncertainty_parser.add_argument('--material', default='Air')
+    uncertainty_parser.add_argument('--thickness', type=float, default=0., help='cm')
+    uncertainty_parser.add_argument('--dose-type', default='Ambient', choices=['Ambient', 'Personal'])
+    uncertainty_parser.add_argument('--activity-rsd', type=float, default=0., help='relative 1 sigma, 0.05 = 5%%')
+    uncertainty_parser.add_argument('--prod-date-sd', type=float, default=0., help='1 sigma, days')
+    uncertainty_parser.add_argument('--distance-sd', type=float, default=0., help='1 sigma, cm')
+    uncertainty_parser.add_argument('--thickness-sd', type=float, default=0., help='1 sigma, cm')
+    uncertainty_parser.add_argument('--samples', type=int, default=1000000)
+    uncertainty_parser.add_argument('--seed', type=int, help='seed for reproducible results')
+    uncertainty_parser.add_argument('--percentiles', type=float, nargs='+', default=[2.5, 50, 97.5])
+    uncertainty_parser.add_argument('--chunk-size', type=int, default=100000)
+    uncertainty_parser.add_argument('--workers', type=int, default=1)
+    uncertainty_parser.set_defaults(func=uncertainty)
+
+    import_parser = commands.add_parser('import', help='bulk load CSV files into the catalogue tables')
+    import_parser.add_argument('--halflife', help='CSV with Isotope, Halflife_d (loaded first)')
+    import_parser.add_argument('--lines', help='CSV with Isotope, Energy (MeV), Yield (%%)')
+    import_parser.add_argument('--sources', help='CSV with Isotope, ProductionDate (mm/dd/yyyy), OriginalActivity '
+                                                 'and optional id, SourceNumber')
+    import_parser.add_argument('--chains', help='CSV with Parent, Daughter, Branching (0..1); daughters need a '
+                                                'half-life, and parent lines should then exclude daughter lines')
+    import_parser.add_argument('--replace', action='store_true',
+                               help='overwrite rows with the same key, and all lines of each isotope in the Lines file')
+    import_parser.add_argument('--strict', action='store_true', help='abort on the first invalid row')
+    import_parser.add_argument('--batch-size', type=int, default=10000)
+    import_parser.set_defaults(func=import_catalogue)
+
+    export_parser = commands.add_parser('export', help='stream a catalogue table to CSV')
+    export_parser.add_argument('table', choices=ORDER)
+    export_parser.add_argument('-o', '--output', default='-', help="CSV file ('-' for stdout)")
+    export_parser.set_defaults(func=export_catalogue)
+
+    migrate_parser = commands.add_parser('migrate', help='add indexes and switch the database to WAL mode')
+    migrate_parser.set_defaults(func=upgrade)
+
+    args = parser.parse_args(argv)
+    if args.profile:
+        instrumentation.enable(args.profile)
+    else:
+        instrumentation.enable_from_env()
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,162 @@
+import csv
+import numpy as np
+
+DATE_FORMAT = '%m/%d/%Y'
+CHUNK_ELEMENTS = 2 ** 22
+
+
+def iso_date(date):
+    month, day, year = str(date).split('/')
+    return f'{int(year):04d}-{int(month):02d}-{int(day):02d}'
+
+
+def to_datetime64(dates):
+    dates = np.asarray(dates)
+    if np.issubdtype(dates.dtype, np.datetime64):
+        return dates.astype('datetime64[D]')
+    return np.array([iso_date(date) for date in dates.ravel()], dtype='datetime64[D]').reshape(dates.shape)
+
+
+def take_valid(values, index, fill):
+    # catalogue sources whose isotope has no Halflife row carry index -1, they get fill instead of wrapping around
+    values = np.asarray(values)
+    index = np.asarray(index)
+    result = np.full(index.shape, fill, dtype=np.result_type(values, np.asarray(fill)))
+    valid = index >= 0
+    result[valid] = values[index[valid]]
+    return result
+
+
+def decay_days(prod_date, cur_date):
+    return int((to_datetime64(cur_date) - to_datetime64(prod_date)).astype(np.int64))
+
+
+def date_range(start, stop, step='D'):
+    start = to_datetime64(start)
+    stop = to_datetime64(stop)
+    if step == 'D':
+        return np.arange(start, stop + 1, dtype='datetime64[D]')
+    elif step == 'W':
+        return np.arange(start, stop + 1, 7, dtype='datetime64[D]')
+    elif step == 'M':
+        months = np.arange(start.astype('datetime64[M]'), stop.astype('datetime64[M]') + 1)
+        month_length = ((months + 1).astype('datetime64[D]') - months.astype('datetime64[D]')).astype(np.int64)
+        day = (start - start.astype('datetime64[M]').astype('datetime64[D]')).astype(np.int64)
+        dates = months.astype('datetime64[D]') + np.minimum(day, month_length - 1)
+        return dates[dates <= stop]
+    raise ValueError(f'Unknown step {step}')
+
+
+def decay_matrix(original_activities, halflives, prod_dates, dates):
+    original_activities = np.round(np.asarray(original_activities, dtype=float))
+    halflives = np.asarray(halflives, dtype=float)
+    days = (to_datetime64(dates)[None, :] - to_datetime64(prod_dates)[:, None]).astype(np.int64)
+    # a source has no activity before it is produced, extrapolating back overflows for short half-lives
+    activity = original_activities[:, None] * np.exp(-(0.693 / halflives)[:, None] * np.maximum(days, 0))
+    return np.round(np.where(days >= 0, activity, 0.)).astype(np.int64)
+
+
+class DecayProjection:
+    def __init__(self, snapshot, chains=None):
+        self._snapshot = snapshot
+        self._chains = chains
+        self._serial = np.asarray(snapshot.source_serial)
+        self._isotope = np.asarray(snapshot.source_name)
+        self._original_activity = np.round(np.asarray(snapshot.source_activity, dtype=float))
+        self._halflife = take_valid(snapshot.halflife, snapshot.source_isotope, np.nan)
+        self._prod_date = np.asarray(snapshot.source_date, dtype='datetime64[D]')
+        # sources without a half-life are not projected
+        self._valid = np.asarray(snapshot.source_isotope) >= 0
+        self._rows = np.flatnonzero(self._valid)
+
+    @property
+    def serial(self):
+        return self._serial
+
+    @property
+    def isotope(self):
+        return self._isotope
+
+    @property
+    def original_activity(self):
+        return self._original_activity
+
+    @property
+    def halflife(self):
+        return self._halflife
+
+    @property
+    def prod_date(self):
+        return self._prod_date
+
+    @property
+    def chains(self):
+        return self._chains
+
+    @property
+    def valid(self):
+        return self._valid
+
+    @property
+    def rows(self):
+        return self._rows
+
+    @property
+    def skipped(self):
+        return np.asarray(self._snapshot.source_id)[~self._valid]
+
+    def require(self, sources):
+        missing = np.asarray(self._snapshot.source_id)[sources][~self._valid[sources]]
+        if len(missing):
+            raise KeyError(f"no half-life for source(s) {', '.join(str(number) for number in missing)}")
+
+    def members(self, sources=None):
+        # (source index, nuclide) of every projected row, daughters follow their parent
+        if sources is None:
+            sources = self._rows
+        self.require(sources)
+        if self._chains is None:
+            return np.arange(len(self._isotope))[sources], self._isotope[sources]
+        rows, nuclides = self._chains.members(self._isotope[sources])
+        return np.arange(len(self._isotope))[sources][rows], nuclides
+
+    def project(self, dates, sources=None):
+        # sources x dates, computed in blocks of sources so temporaries stay near CHUNK_ELEMENTS values
+        if sources is None:
+            sources = self._rows
+        sources = np.arange(len(self._valid))[sources]
+        self.require(sources)
+        dates = to_datetime64(np.atleast_1d(dates))
+        step = max(1, CHUNK_ELEMENTS // max(1, len(dates)))
+        if self._chains is not None:
+            return np.concatenate([self._chains.expand(self._isotope[rows], self._original_activity[rows],
+                                                       self._prod_date[rows], dates)[2].astype(np.int64)
+                                   for rows in (sources[start:start + step] for start in range(0, len(sources), step))]
+                                  or [np.zeros((0, len(dates)), dtype=np.int64)])
+        activity = np.empty((len(sources), len(dates)), dtype=np.int64)
+        for start in range(0, len(sources), step):
+            rows = sources[start:start + step]
+            activity[start:start + step] = decay_matrix(self._original_activity[rows], self._halflife[rows],
+                                                        self._prod_date[rows], dates)
+        return activity
+
+    def iter_project(self, dates, chunk_size=None):
+        # by default as many dates per chunk as keep one chunk of all projected rows near CHUNK_ELEMENTS values
+        dates = to_datetime64(dates)
+        if chunk_size is None:
+            chunk_size = max(1, CHUNK_ELEMENTS // max(1, len(self.members()[0])))
+        for start in range(0, len(dates), chunk_size):
+            chunk = dates[start:start + chunk_size]
+            yield chunk, self.project(chunk)
+
+    def export(self, stream, start, stop, step='D', chunk_size=None):
+        writer = csv.writer(stream)
+        rows, nuclides = self.members()
+        names = [f'{self._isotope[row]} {self._serial[row]}' for row in rows]
+        writer.writerow(['Date'] + [name if nuclide == self._isotope[row] else f'{name} {nuclide}'
+                                    for name, row, nuclide in zip(names, rows, nuclides)])
+        count = 0
+        for dates, activity in self.iter_project(date_range(start, stop, step), chunk_size):
+            writer.writerows([date.strftime(DATE_FORMAT)] + row for date, row in zip(dates.tolist(), activity.T.tolist()))
+            count += len(dates)
+        return count
@@ -0,0 +1,114 @@
+import numpy as np
+from decay import to_datetime64
+
+HOURS_PER_DAY = 24
+
+
+def to_datetime(times):
+    times = np.asarray(times)
+    if np.issubdtype(times.dtype, np.datetime64):
+        return times.astype('datetime64[s]')
+    times = times.astype(str)
+    dates = to_datetime64(np.char.partition(times, ' ')[..., 0])
+    clock = np.char.partition(times, ' ')[..., 2]
+    seconds = np.zeros(times.shape, dtype=np.int64)
+    has_clock = np.char.str_len(clock) > 0
+    if has_clock.any():
+        parts = np.char.split(clock[has_clock], ':')
+        seconds[has_clock] = [int(part[0]) * 3600 + int(part[1]) * 60 + (int(part[2]) if len(part) > 2 else 0)
+                              for part in parts.tolist()]
+    return dates.astype('datetime64[s]') + seconds.astype('timedelta64[s]')
+
+
+def shifts(start, stop, begin='08:00', hours=8., weekdays=(0, 1, 2, 3, 4)):
+    days = np.arange(to_datetime64(start), to_datetime64(stop) + 1, dtype='datetime64[D]')
+    # 1970-01-01 was a Thursday, weekday 0 is Monday
+    days = days[np.isin((days.astype(np.int64) + 3) % 7, weekdays)]
+    hour, minute = [int(part) for part in begin.split(':')[:2]]
+    starts = days.astype('datetime64[s]') + np.timedelta64(hour * 3600 + minute * 60, 's')
+    return starts, starts + np.timedelta64(int(round(hours * 3600)), 's')
+
+
+def integrated_activity(activities, halflives, reference_dates, starts, stops, production_dates=None):
+    # Bq*h of A(t) = A_ref * exp(-ln2/T * (t - t_ref)) over [start, stop], with 0.693 as in Source.decay
+    reference = to_datetime(reference_dates)[..., None]
+    starts = to_datetime(starts)
+    stops = to_datetime(stops)
+    if production_dates is not None:
+        production = to_datetime(production_dates)[..., None]
+        starts = np.maximum(starts, production)
+        stops = np.maximum(stops, production)
+    day = np.timedelta64(86400, 's')
+    t1 = (starts - reference) / day
+    duration = np.maximum((stops - starts) / day, 0.)
+    rate = (0.693 / np.asarray(halflives, dtype=float))[..., None]
+    integral = np.exp(-rate * t1) * np.where(rate > 0, -np.expm1(-rate * duration) / np.where(rate > 0, rate, 1.),
+                                             duration)
+    return np.asarray(activities, dtype=float)[..., None] * integral * HOURS_PER_DAY
+
+
+class ExposureResult:
+    def __init__(self, workers, interval_dose, unit_dose_rate):
+        self._workers = workers
+        self._interval_dose = interval_dose
+        self._unit_dose_rate = unit_dose_rate
+        self._dose = np.zeros(unit_dose_rate.shape)
+        np.add.at(self._dose, workers, interval_dose)
+
+    @property
+    def workers(self):
+        return self._workers
+
+    @property
+    def interval_dose(self):
+        return self._interval_dose
+
+    @property
+    def unit_dose_rate(self):
+        return self._unit_dose_rate
+
+    @property
+    def dose(self):
+        return self._dose
+
+    @property
+    def total_dose(self):
+        return self._dose.sum(axis=-1)
+
+
+class ExposureCalculator:
+    def __init__(self, engine, calculate=None):
+        self._engine = engine
+        self._calculate = calculate or engine.calculate
+
+    @property
+    def engine(self):
+        return self._engine
+
+    def calculate(self, isotopes, activities, halflives, reference_dates, distances, starts, stops, workers=None,
+                  materials='Air', thicknesses=0., dose_type='Ambient', production_dates=None):
+        isotopes = np.atleast_1d(np.asarray(isotopes, dtype=str))
+        starts = np.atleast_1d(to_datetime(starts))
+        stops = np.atleast_1d(to_datetime(stops))
+        workers = np.zeros(len(starts), dtype=np.int64) if workers is None else np.asarray(workers, dtype=np.int64)
+        # geometry is given per worker x source, e.g. distances of shape (workers, 1) or (workers, sources)
+        shape = (int(workers.max()) + 1 if len(workers) else 1, len(isotopes))
+        distances, materials, thicknesses = [np.broadcast_to(values, shape) for values in (
+            np.asarray(distances, dtype=float), np.asarray(materials, dtype=str), np.asarray(thicknesses, dtype=float))]
+        unit = self._calculate(np.broadcast_to(isotopes, shape), 1., distances, materials, thicknesses,
+                               dose_type).total_dose_rate
+
+        activity = integrated_activity(np.broadcast_to(np.asarray(activities, dtype=float), isotopes.shape),
+                                       np.broadcast_to(np.asarray(halflives, dtype=float), isotopes.shape),
+                                       np.broadcast_to(to_datetime(reference_dates), isotopes.shape), starts, stops,
+                                       None if production_dates is None else
+                                       np.broadcast_to(to_datetime(production_dates), isotopes.shape))
+        return ExposureResult(workers, unit[workers] * activity.T, unit)
+
+    def calculate_inventory(self, inventory, rows, distances, starts, stops, workers=None, materials='Air',
+                            thicknesses=0., dose_type='Ambient'):
+        rows = np.atleast_1d(rows)
+        inventory.require(rows)
+        return self.calculate(inventory.names[rows], inventory.original_activities[rows], inventory.halflife[rows],
+                              inventory.dates[rows], distances, starts, stops, workers, materials, thicknesses,
+                              dose_type, inventory.dates[rows])
@@ -0,0 +1,119 @@
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from beckend import registry
+from decay import decay_matrix, to_datetime64
+
+CHUNK_ELEMENTS = 2 ** 20
+
+_field = None
+
+
+def catalogue_sources(snapshot, numbers, date):
+    numbers = np.atleast_1d(np.asarray(numbers, dtype=np.int64))
+    known = np.isin(numbers, snapshot.source_id)
+    if not known.all():
+        raise KeyError(f"unknown source id(s) {', '.join(str(number) for number in numbers[~known])}")
+    rows = np.searchsorted(snapshot.source_id, numbers)
+    index = snapshot.source_isotope[rows]
+    if (index < 0).any():
+        missing = np.asarray(snapshot.source_id)[rows][index < 0]
+        raise KeyError(f"no half-life for source(s) {', '.join(str(number) for number in missing)}")
+    isotopes = np.asarray(snapshot.isotopes)[index]
+    halflife = np.asarray(snapshot.halflife)[index]
+    activities = decay_matrix(snapshot.source_activity[rows], halflife, snapshot.source_date[rows],
+                              to_datetime64([date]))[:, 0]
+    return isotopes, activities
+
+
+class FieldMap:
+    def __init__(self, engine, isotopes, activities, positions, materials='Air', thicknesses=0., dose_type='Ambient',
+                 min_distance=1.):
+        isotopes, activities, materials, thicknesses = np.broadcast_arrays(
+            np.atleast_1d(np.asarray(isotopes, dtype=str)), np.asarray(activities, dtype=float),
+            np.asarray(materials, dtype=str), np.asarray(thicknesses, dtype=float))
+        positions = np.asarray(positions, dtype=float).reshape(len(isotopes), 3)
+        lines = [engine.lines(name) for name in isotopes]
+        counts = np.array([len(line) for line in lines], dtype=np.int64)
+        energy = np.concatenate([line[:, 0] for line in lines])
+        self._source = np.repeat(np.arange(len(isotopes)), counts)
+        self._positions = positions
+        self._min_distance = min_distance
+
+        air = engine.material('Air')
+        kerma = engine.dose_type('Kerma')
+        h10 = engine.dose_type(dose_type)
+        self._emission = np.concatenate([(line[:, 1] / 100) * activity for line, activity in zip(lines, activities)])
+        self._mu_air = np.concatenate([registry.values(air, line[:, 0]) for line in lines])
+        self._shield = np.concatenate([np.exp(-thickness * registry.values(engine.material(material), line[:, 0]))
+                                       for line, material, thickness in zip(lines, materials, thicknesses)])
+        self._dose_factor = np.concatenate([registry.values(kerma, line[:, 0]) * 3600 * registry.values(h10, line[:, 0])
+                                            for line in lines])
+        self._energy = energy
+
+    @property
+    def positions(self):
+        return self._positions
+
+    @property
+    def lines(self):
+        return len(self._energy)
+
+    def evaluate(self, points):
+        points = np.asarray(points, dtype=float).reshape(-1, 3)
+        distance = np.sqrt(((points[:, None, :] - self._positions[None, :, :]) ** 2).sum(axis=-1))
+        distance = np.maximum(distance, self._min_distance)
+        s_a = np.arcsin(np.sin(0.5 / distance) ** 2) / np.pi
+        distance = distance[:, self._source]
+        flux = self._emission * s_a[:, self._source] * self._shield * np.exp(-distance * self._mu_air)
+        return flux.sum(axis=-1), (flux * self._dose_factor).sum(axis=-1)
+
+    def chunk_size(self):
+        return max(1, CHUNK_ELEMENTS // max(1, self.lines))
+
+
+def grid_points(axes, start, stop):
+    shape = tuple(len(axis) for axis in axes)
+    index = np.unravel_index(np.arange(start, stop), shape)
+    points = np.zeros((stop - start, 3))
+    for i, (axis, axis_index) in enumerate(zip(axes, index)):
+        points[:, i] = axis[axis_index]
+    return points
+
+
+def init_field(field):
+    global _field
+    _field = field
+
+
+def map_chunk(path, axes, start, stop):
+    flux, dose_rate = _field.evaluate(grid_points(axes, start, stop))
+    out = np.load(path, mmap_mode='r+')
+    out.reshape(2, -1)[0, start:stop] = dose_rate
+    out.reshape(2, -1)[1, start:stop] = flux
+    out.flush()
+    return stop - start
+
+
+def map_field(field, axes, path, chunk_size=None, workers=1, progress=None):
+    axes = [np.atleast_1d(np.asarray(axis, dtype=float)) for axis in axes]
+    shape = tuple(len(axis) for axis in axes)
+    total = int(np.prod(shape))
+    chunk_size = chunk_size or field.chunk_size()
+    out = np.lib.format.open_memmap(path, mode='w+', dtype=float, shape=(2,) + shape)
+    del out
+    chunks = [(start, min(start + chunk_size, total)) for start in range(0, total, chunk_size)]
+    done = 0
+    if workers <= 1:
+        init_field(field)
+        results = (map_chunk(path, axes, start, stop) for start, stop in chunks)
+        for count in results:
+            done += count
+            if progress is not None:
+                progress(done, total)
+    else:
+        with ProcessPoolExecutor(workers, initializer=init_field, initargs=(field,)) as pool:
+            for count in pool.map(map_chunk, *zip(*[(path, axes, start, stop) for start, stop in chunks])):
+                done += count
+                if progress is not None:
+                    progress(done, total)
+    return np.load(path, mmap_mode='r')
@@ -4,6 +4,13 @@ import tkinter as tk
 from tkinter import ttk
 from ttkthemes import ThemedTk
 from beckend import *
+from pipeline import Pipeline
+from batch import BatchEngine
+from solver import ThicknessSolver
+from exposure import ExposureCalculator, shifts
+from worker import POLL_MS, BackgroundWorker
+
+DEBOUNCE_MS = 150
 
 
 class MainApp(ThemedTk):
@@ -11,11 +18,6 @@ class MainApp(ThemedTk):
         super().__init__()
 
         self._now = datetime.now().strftime('%m/%d/%Y')
-        self._db = Database('DoseCalculator_DB.db')
-        self._source = Source(self._db, 0, self._now, 10)
-        self._airshield = Shield('Air', self._source.distance, self._db.read('Materials', 'Air'))
-        self._shield = Shield('Air', 0, self._db.read('Materials', 'Air'))
-        self._dose_t = DoseType('Ambient', self._db.read('DoseConversionCoefficients', 'Ambient'), self._db.read('DoseConversionCoefficients', 'Kerma'))
 
         self.set_theme('ubuntu')
         self['bg'] = '#f6f4f2'
@@ -44,12 +46,10 @@ class MainApp(ThemedTk):
         catalogue_label.grid(row=0, column=0, pady=vertical_pad)
 
         self._selected_source = tk.StringVar()
-        source_cb = ttk.Combobox(parameters_frame, textvariable=self._selected_source, font=small_font, width=standart_width)
-        source_cb['values'] = [str(self._db.sources.Number[m]) + '  ' + self._db.sources.Isotope[m] + ' ' +
-                               self._db.sources.SourceNumber[m] for m in range(len(self._db.sources))]
-        source_cb['state'] = 'readonly'
-        source_cb.grid(row=0, column=1, pady=vertical_pad)
-        source_cb.bind('<<ComboboxSelected>>', self.source_changed)
+        self._source_cb = ttk.Combobox(parameters_frame, textvariable=self._selected_source, font=small_font, width=standart_width)
+        self._source_cb['state'] = 'readonly'
+        self._source_cb.grid(row=0, column=1, pady=vertical_pad)
+        self._source_cb.bind('<<ComboboxSelected>>', self.source_changed)
 
         source_parameters_label = ttk.Label(parameters_frame, text='Source parameters', font=small_font, width=standart_width)
         source_parameters_label.grid(row=1, column=0, columnspan=2, ipady=vertical_pad)
@@ -58,11 +58,10 @@ class MainApp(ThemedTk):
         isotope_label.grid(row=2, column=0, pady=vertical_pad-5)
 
         self._selected_isotope = tk.StringVar()
-        isotope_cb = ttk.Combobox(parameters_frame, textvariable=self._selected_isotope, font=small_font, width=standart_width)
-        isotope_cb['values'] = [self._db.halflife.Isotope[m] for m in range(len(self._db.halflife))]
-        isotope_cb['state'] = 'readonly'
-        isotope_cb.grid(row=2, column=1, pady=vertical_pad-5)
-        isotope_cb.bind('<<ComboboxSelected>>', self.isotope_changed)
+        self._isotope_cb = ttk.Combobox(parameters_frame, textvariable=self._selected_isotope, font=small_font, width=standart_width)
+        self._isotope_cb['state'] = 'readonly'
+        self._isotope_cb.grid(row=2, column=1, pady=vertical_pad-5)
+        self._isotope_cb.bind('<<ComboboxSelected>>', self.isotope_changed)
 
         halflife_label = ttk.Label(parameters_frame, text='Halflife, days', font=small_font, width=standart_width)
         halflife_label.grid(row=3, column=0, pady=vertical_pad-5)
@@ -76,11 +75,10 @@ class MainApp(ThemedTk):
         pdor_date_label.grid(row=4, column=0, pady=vertical_pad-5)
 
         self._prod_date = tk.StringVar()
-        prod_date_pick = tkcalendar.DateEntry(parameters_frame, selectmode='day', width=standart_width, textvariable=self._prod_date,
-                                              date_pattern='m/d/Y', font=small_font)
-        prod_date_pick.grid(row=4, column=1, pady=vertical_pad-5)
-        prod_date_pick['state'] = 'readonly'
-        prod_date_pick.bind('<<DateEntrySelected>>', self.prod_date_changed)
+        self._prod_date_pick = tkcalendar.DateEntry(parameters_frame, selectmode='day', width=standart_width, textvariable=self._prod_date,
+                                                    date_pattern='m/d/Y', font=small_font)
+        self._prod_date_pick.grid(row=4, column=1, pady=vertical_pad-5)
+        self._prod_date_pick['state'] = 'readonly'
 
         original_activity_label = ttk.Label(parameters_frame, text='Original activity, Bq', font=small_font, width=standart_width)
         original_activity_label.grid(row=5, column=0, pady=vertical_pad-5)
@@ -89,17 +87,15 @@ class MainApp(ThemedTk):
         original_activity_box = ttk.Entry(parameters_frame, textvariable=self._original_activity, width=standart_width + 2,
                                           font=small_font)
         original_activity_box.grid(row=5, column=1, pady=vertical_pad-5)
-        self._original_activity.trace('w', self.original_activity_changed)
 
         cur_date_label = ttk.Label(parameters_frame, text='Current date', font=small_font, width=standart_width)
         cur_date_label.grid(row=6, column=0, pady=vertical_pad-5)
 
         self._cur_date = tk.StringVar()
-        cur_date_pick = tkcalendar.DateEntry(parameters_frame, selectmode='day', width=standart_width, textvariable=self._cur_date,
-                                             date_pattern='mm/dd/Y', font=small_font)
-        cur_date_pick.grid(row=6, column=1, pady=vertical_pad-5)
-        cur_date_pick['state'] = 'readonly'
-        cur_date_pick.bind('<<DateEntrySelected>>', self.cur_date_changed)
+        self._cur_date_pick = tkcalendar.DateEntry(parameters_frame, selectmode='day', width=standart_width, textvariable=self._cur_date,
+                                                   date_pattern='mm/dd/Y', font=small_font)
+        self._cur_date_pick.grid(row=6, column=1, pady=vertical_pad-5)
+        self._cur_date_pick['state'] = 'readonly'
 
         current_activity_label = ttk.Label(parameters_frame, text='Current activity, Bq', font=small_font, width=standart_width)
         current_activity_label.grid(row=7, column=0, pady=vertical_pad-5)
@@ -107,7 +103,6 @@ class MainApp(ThemedTk):
         self._current_activity = tk.StringVar()
         current_activity_box = ttk.Entry(parameters_frame, textvariable=self._current_activity, width=standart_width + 2, font=small_font)
         current_activity_box.grid(row=7, column=1, pady=vertical_pad-5)
-        self._current_activity.trace('w', self.current_activity_changed)
 
         shield_parameters_label = ttk.Label(parameters_frame, text='Shield parameters', font=small_font, width=standart_width)
         shield_parameters_label.grid(row=8, column=0, columnspan=2, pady=vertical_pad)
@@ -128,7 +123,6 @@ class MainApp(ThemedTk):
         self._thickness = tk.StringVar()
         thickness_box = ttk.Entry(parameters_frame, textvariable=self._thickness, width=standart_width + 2, font=small_font)
         thickness_box.grid(row=10, column=1, pady=vertical_pad-5)
-        self._thickness.trace('w', self.thickness_changed)
 
         distance_label = ttk.Label(parameters_frame, text='Distance, cm', font=small_font, width=standart_width)
         distance_label.grid(row=11, column=0, pady=vertical_pad-5)
@@ -136,7 +130,6 @@ class MainApp(ThemedTk):
         self._distance = tk.StringVar()
         distance_box = ttk.Entry(parameters_frame, textvariable=self._distance, width=standart_width + 2, font=small_font)
         distance_box.grid(row=11, column=1, pady=vertical_pad-5)
-        self._distance.trace('w', self.distance_changed)
 
         dose_type_label = ttk.Label(parameters_frame, text='Dose type', font=small_font, width=standart_width)
         dose_type_label.grid(row=12, column=0, pady=vertical_pad)
@@ -148,6 +141,14 @@ class MainApp(ThemedTk):
         dose_type_cb.grid(row=12, column=1, pady=vertical_pad-5)
         dose_type_cb.bind('<<ComboboxSelected>>', self.dose_type_changed)
 
+        shielding_button = ttk.Button(parameters_frame, text='Required shielding', width=standart_width,
+                                      command=self.shielding_window)
+        shielding_button.grid(row=13, column=0, pady=vertical_pad)
+
+        exposure_button = ttk.Button(parameters_frame, text='Exposure dose', width=standart_width,
+                                     command=self.exposure_window)
+        exposure_button.grid(row=13, column=1, pady=vertical_pad)
+
         self._der_label = ttk.Label(results_frame, text='Dose equivalent rate, uSv/h', font=big_font)
         self._der_label.grid(row=0, column=0, pady=vertical_pad)
 
@@ -160,6 +161,11 @@ class MainApp(ThemedTk):
         self._flux_result_label = ttk.Label(results_frame, text='0', font=big_font)
         self._flux_result_label.grid(row=4, column=0, pady=vertical_pad, padx=vertical_pad)
 
+        self._progress = ttk.Progressbar(results_frame, mode='indeterminate', length=200)
+        self._progress.grid(row=5, column=0, pady=vertical_pad)
+        self._busy = False
+        self._rendered_version = None
+
         columnwidth = 79
         style = ttk.Style()
         style.configure('mystyle.Treeview', font=small_font)
@@ -182,8 +188,69 @@ class MainApp(ThemedTk):
         self._table.configure(yscrollcommand=scrollbar.set)
         scrollbar.grid(row=0, column=4, ipady=85)
 
+        self._worker = BackgroundWorker(self)
+        self._worker.on_busy(self.busy_changed)
+        # the data load blocks, so it waits until the window skeleton has been exposed and painted
+        self._exposed = False
+        self.bind('<Expose>', self.first_exposed, add='+')
+
+    @property
+    def worker(self):
+        return self._worker
+
+    def destroy(self):
+        self._worker.shutdown()
+        super().destroy()
+
+    def busy_changed(self, busy, progress):
+        if busy and progress is not None:
+            if self._busy:
+                self._progress.stop()
+            self._progress.configure(mode='determinate', maximum=progress[1], value=progress[0])
+        elif busy and not self._busy:
+            self._progress.configure(mode='indeterminate')
+            self._progress.start(POLL_MS)
+        elif not busy:
+            self._progress.stop()
+            self._progress.configure(value=0)
+        self._busy = busy and progress is None
+
+    def first_exposed(self, event):
+        if not self._exposed:
+            self._exposed = True
+            self.after(0, self.load_data)
+
+    def load_data(self):
+        self.update_idletasks()
+        self._db = Database('DoseCalculator_DB.db', snapshot=True)
+        # sources whose isotope has no half-life row cannot be shown, start from the first one that can
+        valid = np.flatnonzero(self._db.inventory.isotope_index >= 0)
+        if not len(valid):
+            self._der_result_label['text'] = 'No half-life'
+            return
+        self._source = Source(self._db, int(valid[0]), self._now, 10)
+        self._airshield = Shield('Air', self._source.distance, registry.table(self._db, 'Materials', 'Air'))
+        self._shield = Shield('Air', 0, registry.table(self._db, 'Materials', 'Air'))
+        self._dose_t = DoseType('Ambient', registry.table(self._db, 'DoseConversionCoefficients', 'Ambient'), registry.table(self._db, 'DoseConversionCoefficients', 'Kerma'))
+        self._pipeline = Pipeline(self._source, self._shield, self._airshield, self._dose_t)
+        self._engine = BatchEngine(self._db)
+        self._solver = ThicknessSolver(self._engine)
+        self._exposure = ExposureCalculator(self._engine)
+        self._pending_update = None
+        self._rows = []
+
+        self._source_cb['values'] = [str(self._db.sources.Number[m]) + '  ' + self._db.sources.Isotope[m] + ' ' +
+                                     self._db.sources.SourceNumber[m] for m in range(len(self._db.sources))]
+        self._isotope_cb['values'] = [self._db.halflife.Isotope[m] for m in range(len(self._db.halflife))]
         self.screen_update()
 
+        self._prod_date_pick.bind('<<DateEntrySelected>>', self.prod_date_changed)
+        self._cur_date_pick.bind('<<DateEntrySelected>>', self.cur_date_changed)
+        self._original_activity.trace('w', self.original_activity_changed)
+        self._current_activity.trace('w', self.current_activity_changed)
+        self._thickness.trace('w', self.thickness_changed)
+        self._distance.trace('w', self.distance_changed)
+
     def screen_update(self):
         # self._selected_source.set(str(self._source.number + 1) + ' ' + self._source.name + ' ' + self._source.serial)
         self._selected_isotope.set(self._source.name)
@@ -197,98 +264,204 @@ class MainApp(ThemedTk):
         self._dose_type.set(self._dose_t.type)
         self.results_update()
 
+    def schedule_update(self):
+        if self._pending_update is not None:
+            self.after_cancel(self._pending_update)
+        self._pending_update = self.after(DEBOUNCE_MS, self.results_update)
+
     def source_changed(self, event):
         source_index = int(self._selected_source.get().split(' ')[0]) - 1
-        self._source = Source(self._db, source_index, self._cur_date.get(), float(self._distance.get()))
+        try:
+            self._source = Source(self._db, source_index, self._cur_date.get(), float(self._distance.get()))
+        except KeyError:
+            self._der_result_label['text'] = 'No half-life'
+            return
+        self._pipeline.source = self._source
         self.screen_update()
 
     def isotope_changed(self, event):
-        self._source.name = self._selected_isotope.get()
-        self._source.halflife = self._db.halflife.Half_life_d[self._db.halflife.Isotope == self._source.name].values[0]
-        self._source.prod_date = self._prod_date.get()
-        self._source.original_activity = int(self._original_activity.get())
-        self._source.lines = self._db.read('Lines', self._source.name)
-        self._source.decay()
+        name = self._selected_isotope.get()
+        self._pipeline.configure_source('lines', 'activity', decay=True, name=name,
+                                        halflife=self._db.halflife_of(name), prod_date=self._prod_date.get(),
+                                        original_activity=int(self._original_activity.get()),
+                                        lines=self._db.read('Lines', name))
         self.screen_update()
 
     def original_activity_changed(self, *args):
         try:
-            self._source.original_activity = int(self._original_activity.get())
-            self._source.decay()
-            self.screen_update()
+            self._pipeline.configure_source('activity', decay=True,
+                                            original_activity=int(self._original_activity.get()))
+            self._current_activity.set(self._source.current_activity)
         except ValueError:
             self._der_result_label['text'] = 'Wrong activity'
 
     def cur_date_changed(self, event):
-        p_d = datetime.strptime(self._prod_date.get(), '%m/%d/%Y')
-        c_d = datetime.strptime(self._cur_date.get(), '%m/%d/%Y')
-        delta = c_d - p_d
-        if delta.days >= 0:
-            self._source.cur_date = self._cur_date.get()
-            self._source.decay()
-            self.screen_update()
+        if decay_days(self._prod_date.get(), self._cur_date.get()) >= 0:
+            self._pipeline.configure_source('activity', decay=True, cur_date=self._cur_date.get())
+            self._current_activity.set(self._source.current_activity)
         else:
             self._der_result_label['text'] = 'Wrong date'
 
     def prod_date_changed(self, event):
-        p_d = datetime.strptime(self._prod_date.get(), '%m/%d/%Y')
-        c_d = datetime.strptime(self._cur_date.get(), '%m/%d/%Y')
-        delta = c_d - p_d
-        if delta.days >= 0:
-            self._source.prod_date = self._prod_date.get()
-            self._source.decay()
-            self.screen_update()
+        if decay_days(self._prod_date.get(), self._cur_date.get()) >= 0:
+            self._pipeline.configure_source('activity', decay=True, prod_date=self._prod_date.get())
+            self._current_activity.set(self._source.current_activity)
         else:
             self._der_result_label['text'] = 'Wrong date'
 
     def current_activity_changed(self, *args):
         try:
-            self._source.current_activity = int(self._current_activity.get())
-            self.results_update()
+            self._pipeline.configure_source('activity', current_activity=int(self._current_activity.get()))
+            self.schedule_update()
         except ValueError:
             self._der_result_label['text'] = 'Wrong activity'
 
     def material_changed(self, event):
-        self._shield = Shield(self._selected_material.get(), float(self._thickness.get()), self._db.read('Materials', self._selected_material.get()))
-        self._shield.attenuation(self._source.lines[:, 0])
-        self.results_update()
+        material = self._selected_material.get()
+        self._pipeline.configure_shield(material=material,
+                                        coefficients=registry.table(self._db, 'Materials', material))
+        self.schedule_update()
 
     def thickness_changed(self, *args):
         try:
-            self._shield = Shield(self._selected_material.get(), float(self._thickness.get()), self._db.read('Materials', self._selected_material.get()))
-            self._shield.attenuation(self._source.lines[:, 0])
-            self.results_update()
+            self._pipeline.configure_shield(thickness=float(self._thickness.get()))
+            self.schedule_update()
         except ValueError:
             self._der_result_label['text'] = 'Wrong thickness'
 
     def distance_changed(self, *args):
         try:
-            self._source.distance = float(self._distance.get())
-            self.results_update()
+            self._pipeline.configure_source('distance', distance=float(self._distance.get()))
+            self.schedule_update()
         except ValueError:
             self._der_result_label['text'] = 'Wrong distance'
 
     def dose_type_changed(self, event):
-        self._dose_t.type = self._dose_type.get()
-        self._dose_t.coefficients = self._db.read('DoseConversionCoefficients', self._dose_t.type)
-        self.results_update()
+        dose_type = self._dose_type.get()
+        self._pipeline.configure_dose_type(
+            type=dose_type, coefficients=registry.table(self._db, 'DoseConversionCoefficients', dose_type))
+        self.schedule_update()
+
+    def shielding_window(self):
+        window = tk.Toplevel(self)
+        window['bg'] = '#f6f4f2'
+        window.title('Required shielding')
+        window.resizable(False, False)
+
+        target_label = ttk.Label(window, text='Target dose rate, uSv/h', font=("Helvetica", 10))
+        target_label.grid(row=0, column=0, padx=10, pady=10)
+
+        self._target_dose = tk.StringVar(value='1')
+        target_box = ttk.Entry(window, textvariable=self._target_dose, width=12, font=("Helvetica", 10))
+        target_box.grid(row=0, column=1, padx=10, pady=10)
+
+        self._shielding_table = ttk.Treeview(window, columns=('Material', 'Thickness'), show='headings',
+                                             style='mystyle.Treeview', height=8)
+        self._shielding_table.heading('Material', text='Material')
+        self._shielding_table.heading('Thickness', text='Thickness, cm')
+        self._shielding_table.grid(row=1, column=0, columnspan=2, padx=10, pady=10)
+
+        self._target_dose.trace('w', self.shielding_update)
+        self.shielding_update()
+
+    def shielding_update(self, *args):
+        try:
+            target = float(self._target_dose.get())
+        except ValueError:
+            return
+        self._worker.submit('shielding', self._solver.solve, self._source.name, self._source.current_activity,
+                            self._source.distance, target, dose_type=self._dose_t.type, done=self.shielding_render)
+
+    def shielding_render(self, result):
+        materials, thickness = result
+        if not self._shielding_table.winfo_exists():
+            return
+        for row in self._shielding_table.get_children():
+            self._shielding_table.delete(row)
+        for material, value in zip(materials, thickness[0]):
+            self._shielding_table.insert('', tk.END, values=(material, np.round(value, 3)))
+
+    def exposure_window(self):
+        window = tk.Toplevel(self)
+        window['bg'] = '#f6f4f2'
+        window.title('Exposure dose')
+        window.resizable(False, False)
+        small_font = ("Helvetica", 10)
+
+        self._exposure_start = tk.StringVar(value=self._cur_date.get())
+        self._exposure_stop = tk.StringVar(value=self._cur_date.get())
+        self._shift_begin = tk.StringVar(value='08:00')
+        self._shift_hours = tk.StringVar(value='8')
+        self._weekdays_only = tk.BooleanVar(value=True)
+        fields = [('First day', tkcalendar.DateEntry(window, selectmode='day', width=12, textvariable=self._exposure_start,
+                                                     date_pattern='mm/dd/Y', font=small_font)),
+                  ('Last day', tkcalendar.DateEntry(window, selectmode='day', width=12, textvariable=self._exposure_stop,
+                                                    date_pattern='mm/dd/Y', font=small_font)),
+                  ('Shift begins, hh:mm', ttk.Entry(window, textvariable=self._shift_begin, width=14, font=small_font)),
+                  ('Shift length, h', ttk.Entry(window, textvariable=self._shift_hours, width=14, font=small_font)),
+                  ('Weekdays only', ttk.Checkbutton(window, variable=self._weekdays_only))]
+        for row, (text, widget) in enumerate(fields):
+            ttk.Label(window, text=text, font=small_font).grid(row=row, column=0, padx=10, pady=5)
+            widget.grid(row=row, column=1, padx=10, pady=5)
+
+        self._exposure_result = ttk.Label(window, text='0', font=("Helvetica", 14))
+        self._exposure_result.grid(row=len(fields), column=0, columnspan=2, padx=10, pady=10)
+
+        for variable in (self._exposure_start, self._exposure_stop, self._shift_begin, self._shift_hours,
+                         self._weekdays_only):
+            variable.trace('w', self.exposure_update)
+        self.exposure_update()
+
+    def exposure_update(self, *args):
+        try:
+            weekdays = (0, 1, 2, 3, 4) if self._weekdays_only.get() else tuple(range(7))
+            starts, stops = shifts(self._exposure_start.get(), self._exposure_stop.get(), self._shift_begin.get(),
+                                   float(self._shift_hours.get()), weekdays)
+        except ValueError:
+            self._exposure_result['text'] = 'Wrong shift'
+            return
+        self._worker.submit('exposure', self._exposure.calculate, self._source.name, self._source.current_activity,
+                            self._source.halflife, self._source.cur_date, self._source.distance, starts, stops,
+                            materials=self._shield.material, thicknesses=self._shield.thickness,
+                            dose_type=self._dose_t.type, production_dates=self._source.prod_date,
+                            done=lambda result: self.exposure_render(len(starts), result))
+
+    def exposure_render(self, count, result):
+        if not self._exposure_result.winfo_exists():
+            return
+        dose = result.total_dose[0]
+        unit = '\u03BCSv'
+        if dose > 1000000:
+            dose, unit = dose / 1000000, 'Sv'
+        elif dose > 1000:
+            dose, unit = dose / 1000, 'mSv'
+        self._exposure_result['text'] = f'{count} shifts, {np.round(dose, 3)} {unit}'
+
+    def table_update(self, lines, flux, kerma_rate, dose_rate):
+        values = np.round(np.column_stack((lines[:, 0] * 1000, lines[:, 1], kerma_rate, dose_rate, flux)), 3).tolist()
+        while len(self._rows) > len(values):
+            self._table.delete(self._rows.pop())
+        for i, row in enumerate(values):
+            if i < len(self._rows):
+                self._table.item(self._rows[i], values=row)
+            else:
+                self._rows.append(self._table.insert('', tk.END, values=row))
 
     def results_update(self):
-        self._shield.attenuation(self._source.lines[:, 0])
-        self._airshield.attenuation(self._source.lines[:, 0])
-        self._source.line_flux(self._shield, self._airshield)
-        self._source.line_kerma_rate(self._dose_t)
-        self._source.line_dose_rate(self._dose_t)
-        for row in self._table.get_children():
-            self._table.delete(row)
-        for i in range(len(self._source.lines)):
-            self._table.insert('', tk.END,
-                         values=(np.round(self._source.lines[i, 0] * 1000, 3), np.round(self._source.lines[i, 1], 3),
-                                 np.round(self._source.kerma_rate[i], 3), np.round(self._source.dose_rate[i], 3),
-                                 np.round(self._source.flux[i], 3)))
-
-        total_dose = np.sum(self._source.dose_rate)
-        total_flux = np.round(np.sum(self._source.flux), 3)
+        if self._pending_update is not None:
+            self.after_cancel(self._pending_update)
+            self._pending_update = None
+        self._worker.submit('results', self._pipeline.results, done=self.results_render)
+
+    def results_render(self, result):
+        version, lines, flux, kerma_rate, dose_rate = result
+        if version == self._rendered_version:
+            return
+        self._rendered_version = version
+        self.table_update(lines, flux, kerma_rate, dose_rate)
+
+        total_dose = np.sum(dose_rate)
+        total_flux = np.round(np.sum(flux), 3)
 
         if total_dose > 1000000:
             total_dose = total_dose / 1000000
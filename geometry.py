@@ -0,0 +1,231 @@
+import functools
+import numpy as np
+from beckend import registry
+from batch import BatchResult
+
+ORDER = 8
+CHUNK_ELEMENTS = 2 ** 20
+AXES = {'x': 0, 'y': 1, 'z': 2}
+
+
+@functools.lru_cache(maxsize=64)
+def gauss_legendre(order):
+    # nodes and weights on [0, 1]
+    nodes, weights = np.polynomial.legendre.leggauss(order)
+    nodes, weights = (nodes + 1) / 2, weights / 2
+    nodes.flags.writeable = False
+    weights.flags.writeable = False
+    return nodes, weights
+
+
+def disk_nodes(radius, order):
+    # uniform over the area: Gauss-Legendre in r with weight 2r, equally spaced angles (exact for periodic terms)
+    u, w = gauss_legendre(order)
+    angles = 2 * np.pi * (np.arange(2 * order) + 0.5) / (2 * order)
+    r = np.repeat(u * radius, len(angles))
+    angles = np.tile(angles, order)
+    weights = np.repeat(2 * u * w, 2 * order) / (2 * order)
+    return r * np.cos(angles), r * np.sin(angles), weights
+
+
+@functools.lru_cache(maxsize=256)
+def quadrature(kind, dimensions, axis, order):
+    # nodes (N, 3) around the source centre and weights summing to 1, i.e. the share of the emission per node
+    u, w = gauss_legendre(order)
+    if kind == 'point':
+        nodes, weights = np.zeros((1, 3)), np.ones(1)
+    elif kind == 'line':
+        nodes = np.zeros((order, 3))
+        nodes[:, AXES[axis]] = (u - 0.5) * dimensions[0]
+        weights = w.copy()
+    elif kind == 'disk':
+        x, y, weights = disk_nodes(dimensions[0], order)
+        nodes = np.zeros((len(weights), 3))
+        nodes[:, [i for i in range(3) if i != AXES[axis]]] = np.column_stack((x, y))
+    elif kind == 'cylinder':
+        x, y, disk_weights = disk_nodes(dimensions[0], order)
+        nodes = np.zeros((len(disk_weights) * order, 3))
+        nodes[:, [i for i in range(3) if i != AXES[axis]]] = np.column_stack((np.tile(x, order), np.tile(y, order)))
+        nodes[:, AXES[axis]] = np.repeat((u - 0.5) * dimensions[1], len(disk_weights))
+        weights = np.repeat(w, len(disk_weights)) * np.tile(disk_weights, order)
+    elif kind == 'box':
+        grid = np.meshgrid(*[(u - 0.5) * size for size in dimensions], indexing='ij')
+        nodes = np.column_stack([axis_nodes.ravel() for axis_nodes in grid])
+        weights = (w[:, None, None] * w[None, :, None] * w[None, None, :]).ravel()
+    else:
+        raise KeyError(f'unknown geometry {kind}')
+    nodes.flags.writeable = False
+    weights.flags.writeable = False
+    return nodes, weights
+
+
+class Geometry:
+    # the detector lies on the z axis, shields are slabs perpendicular to it between source and detector
+    kind = 'point'
+
+    def __init__(self, dimensions=(), axis='z', order=ORDER):
+        if axis not in AXES:
+            raise ValueError(f'axis must be one of {", ".join(AXES)}, got {axis!r}')
+        if any(not size > 0 for size in dimensions):
+            raise ValueError(f'{self.kind} dimensions must be positive, got {dimensions}')
+        self._dimensions = tuple(float(size) for size in dimensions)
+        self._axis = axis
+        self._order = int(order)
+
+    @property
+    def dimensions(self):
+        return self._dimensions
+
+    @property
+    def axis(self):
+        return self._axis
+
+    @property
+    def order(self):
+        return self._order
+
+    @property
+    def key(self):
+        return self.kind, self._dimensions, self._axis, self._order
+
+    @property
+    def depth(self):
+        # half extent along z, detectors must be farther than this
+        return 0.
+
+    @property
+    def volumetric(self):
+        return False
+
+    def quadrature(self):
+        return quadrature(*self.key)
+
+    def chord(self, points, directions):
+        # path from each node to the source surface towards the detector, zero for points, rods and thin disks
+        return np.zeros(points.shape[:-1])
+
+
+class Point(Geometry):
+    kind = 'point'
+
+    def __init__(self, order=1):
+        super().__init__((), 'z', 1)
+
+
+class Line(Geometry):
+    kind = 'line'
+
+    def __init__(self, length, axis='x', order=ORDER * 2):
+        super().__init__((length,), axis, order)
+
+    @property
+    def depth(self):
+        return self._dimensions[0] / 2 if self._axis == 'z' else 0.
+
+
+class Disk(Geometry):
+    kind = 'disk'
+
+    def __init__(self, radius, axis='z', order=ORDER):
+        super().__init__((radius,), axis, order)
+
+    @property
+    def depth(self):
+        return 0. if self._axis == 'z' else self._dimensions[0]
+
+
+class Cylinder(Geometry):
+    kind = 'cylinder'
+
+    def __init__(self, radius, height, axis='z', order=ORDER):
+        super().__init__((radius, height), axis, order)
+
+    @property
+    def depth(self):
+        radius, height = self._dimensions
+        return height / 2 if self._axis == 'z' else radius
+
+    @property
+    def volumetric(self):
+        return True
+
+    def chord(self, points, directions):
+        radius, height = self._dimensions
+        a = AXES[self._axis]
+        b, c = [i for i in range(3) if i != a]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            along = np.where(directions[..., a] != 0,
+                             (np.sign(directions[..., a]) * height / 2 - points[..., a]) / directions[..., a], np.inf)
+            quadratic = directions[..., b] ** 2 + directions[..., c] ** 2
+            half = points[..., b] * directions[..., b] + points[..., c] * directions[..., c]
+            rest = points[..., b] ** 2 + points[..., c] ** 2 - radius ** 2
+            radial = np.where(quadratic > 0, (np.sqrt(np.maximum(half ** 2 - quadratic * rest, 0.)) - half) /
+                              quadratic, np.inf)
+        return np.maximum(np.minimum(along, radial), 0.)
+
+
+class Box(Geometry):
+    kind = 'box'
+
+    def __init__(self, x, y, z, order=ORDER):
+        super().__init__((x, y, z), 'z', order)
+
+    @property
+    def depth(self):
+        return self._dimensions[2] / 2
+
+    @property
+    def volumetric(self):
+        return True
+
+    def chord(self, points, directions):
+        half = np.asarray(self._dimensions) / 2
+        with np.errstate(divide='ignore', invalid='ignore'):
+            exits = np.where(directions != 0, (np.sign(directions) * half - points) / directions, np.inf)
+        return np.maximum(exits.min(axis=-1), 0.)
+
+
+GEOMETRIES = {geometry.kind: geometry for geometry in (Point, Line, Disk, Cylinder, Box)}
+
+
+class GeometryCalculator:
+    def __init__(self, engine):
+        self._engine = engine
+
+    @property
+    def engine(self):
+        return self._engine
+
+    def calculate(self, isotope, activity, geometry, distances, material='Air', thickness=0., dose_type='Ambient',
+                  source_material=None, offsets=0.):
+        # point kernel with the same geometry factor as Source.line_flux, integrated over the source by quadrature
+        distances, offsets = np.broadcast_arrays(np.asarray(distances, dtype=float), np.asarray(offsets, dtype=float))
+        if np.any(distances <= geometry.depth):
+            raise ValueError(f'distances must exceed the source half depth {geometry.depth} cm')
+        lines = self._engine.lines(isotope)
+        energy, yields = lines[:, 0], lines[:, 1]
+        mu_air = registry.values(self._engine.material('Air'), energy)
+        mu_shield = registry.values(self._engine.material(material), energy) * thickness
+        mu_self = np.zeros(len(energy))
+        if source_material is not None and geometry.volumetric:
+            mu_self = registry.values(self._engine.material(source_material), energy)
+        kerma = registry.values(self._engine.dose_type('Kerma'), energy) * 3600
+        h10 = registry.values(self._engine.dose_type(dose_type), energy)
+
+        nodes, weights = geometry.quadrature()
+        detectors = np.column_stack((offsets.ravel(), np.zeros(distances.size), distances.ravel()))
+        flux = np.zeros((len(detectors), len(energy)))
+        chunk = max(1, CHUNK_ELEMENTS // max(1, len(nodes) * len(energy)))
+        for start in range(0, len(detectors), chunk):
+            rays = detectors[start:start + chunk, None, :] - nodes[None, :, :]
+            r = np.sqrt((rays ** 2).sum(axis=-1))
+            path = geometry.chord(np.broadcast_to(nodes, rays.shape), rays / r[..., None])
+            # slab shield is crossed obliquely by rays from off-axis nodes
+            slant = r / rays[..., 2]
+            s_a = np.arcsin(np.sin(0.5 / r) ** 2) / np.pi
+            attenuation = np.exp(-r[..., None] * mu_air - slant[..., None] * mu_shield - path[..., None] * mu_self)
+            flux[start:start + chunk] = np.einsum('dn,dnl->dl', s_a * weights, attenuation)
+
+        flux = (flux * (yields / 100) * activity).reshape(distances.shape + (len(energy),))
+        kerma_rate = flux * kerma
+        return BatchResult(energy, yields, flux, kerma_rate, kerma_rate * h10)
@@ -0,0 +1,182 @@
+import os
+import sys
+import csv
+import json
+import time
+import atexit
+import cProfile
+import functools
+
+ENV_VAR = 'DOSECALC_PROFILE'
+UI_FIELDS = {
+    'source': ('_selected_source', 'source_changed'),
+    'isotope': ('_selected_isotope', 'isotope_changed'),
+    'prod_date': ('_prod_date', 'prod_date_changed'),
+    'cur_date': ('_cur_date', 'cur_date_changed'),
+    'material': ('_selected_material', 'material_changed'),
+    'dose_type': ('_dose_type', 'dose_type_changed'),
+    'original_activity': ('_original_activity', None),
+    'current_activity': ('_current_activity', None),
+    'thickness': ('_thickness', None),
+    'distance': ('_distance', None),
+}
+
+
+class Stats:
+    def __init__(self):
+        self._counters = {}
+        self._timers = {}
+
+    @property
+    def counters(self):
+        return self._counters
+
+    @property
+    def timers(self):
+        return self._timers
+
+    def count(self, name, value=1):
+        self._counters[name] = self._counters.get(name, 0) + value
+
+    def time(self, name, elapsed):
+        timer = self._timers.get(name)
+        if timer is None:
+            timer = self._timers[name] = {'calls': 0, 'total': 0., 'max': 0.}
+        timer['calls'] += 1
+        timer['total'] += elapsed
+        timer['max'] = max(timer['max'], elapsed)
+
+    def clear(self):
+        self._counters.clear()
+        self._timers.clear()
+
+    def rows(self):
+        rows = [{'kind': 'timer', 'name': name, 'calls': timer['calls'], 'total_s': timer['total'],
+                 'mean_s': timer['total'] / timer['calls'], 'max_s': timer['max']}
+                for name, timer in sorted(self._timers.items())]
+        rows += [{'kind': 'counter', 'name': name, 'calls': value}
+                 for name, value in sorted(self._counters.items())]
+        return rows
+
+    def dump(self, path):
+        if path.endswith('.csv'):
+            with open(path, 'w', newline='') as f:
+                writer = csv.DictWriter(f, fieldnames=['kind', 'name', 'calls', 'total_s', 'mean_s', 'max_s'])
+                writer.writeheader()
+                writer.writerows(self.rows())
+        else:
+            with open(path, 'w') as f:
+                json.dump({'timers': self._timers, 'counters': self._counters}, f, indent=2)
+
+
+stats = Stats()
+_installed = set()
+
+
+def wrap(owner, attribute, stage, after=None):
+    if (owner, attribute) in _installed:
+        return
+    original = getattr(owner, attribute)
+
+    @functools.wraps(original)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        result = original(*args, **kwargs)
+        stats.time(stage, time.perf_counter() - start)
+        if after is not None:
+            after(args, result)
+        return result
+
+    setattr(owner, attribute, wrapper)
+    _installed.add((owner, attribute))
+
+
+def count_query(args, result):
+    if args[0].snapshot is None:
+        stats.count('sql_queries')
+
+
+def count_interpolator(args, result):
+    stats.count('interpolators_built')
+
+
+def count_stages(args, result):
+    for name in args[0].recomputed:
+        stats.count('pipeline.' + name)
+
+
+def count_cache(args, result):
+    stats.count('cache_misses' if result is None else 'cache_hits')
+
+
+def count_rows(args, result):
+    stats.count('rows_rendered', len(args[0]._rows))
+
+
+def install(gui=None):
+    import beckend
+    import batch
+    import cache
+    import pipeline
+    import snapshot
+    wrap(beckend.Database, 'read', 'Database.read', count_query)
+    wrap(beckend.Interpolator, '__init__', 'Interpolator.build', count_interpolator)
+    wrap(beckend.Shield, 'attenuation', 'Shield.attenuation')
+    wrap(beckend.Source, 'decay', 'Source.decay')
+    wrap(snapshot, 'read_cache', 'snapshot.read_cache')
+    wrap(snapshot, 'build_snapshot', 'snapshot.build_snapshot')
+    wrap(pipeline.Pipeline, 'update', 'Pipeline.update', count_stages)
+    wrap(pipeline.Pipeline, 'results', 'Pipeline.results')
+    # the GUI computes through the pipeline stages, Source.line_* is only used by scripts
+    for name, _ in pipeline.STAGES:
+        wrap(pipeline.Pipeline, '_' + name, 'Pipeline.' + name)
+    wrap(batch.BatchEngine, 'calculate', 'BatchEngine.calculate')
+    wrap(cache.ResultCache, 'get', 'ResultCache.get', count_cache)
+    wrap(cache.ResultCache, 'calculate', 'ResultCache.calculate')
+    if gui or (gui is None and 'frontend' in sys.modules):
+        import frontend
+        wrap(frontend.MainApp, 'load_data', 'MainApp.load_data')
+        wrap(frontend.MainApp, 'results_update', 'MainApp.results_update')
+        wrap(frontend.MainApp, 'results_render', 'MainApp.results_render')
+        wrap(frontend.MainApp, 'table_update', 'MainApp.table_update', count_rows)
+
+
+def enable(path):
+    install()
+    atexit.register(stats.dump, path)
+
+
+def enable_from_env():
+    path = os.environ.get(ENV_VAR)
+    if path:
+        enable(path)
+    return path
+
+
+def run_ui_events(app, events):
+    for field, value in events:
+        variable, handler = UI_FIELDS[field]
+        getattr(app, variable).set(value)
+        if handler is not None:
+            getattr(app, handler)(None)
+        app.results_update()
+        # calculations run on the worker thread, wait so each event is measured end to end
+        app.worker.wait()
+        app.update()
+
+
+def profile_ui(events, output, repeat=1):
+    import frontend
+    install(gui=True)
+    app = frontend.MainApp()
+    app.update()
+    # cProfile only sees the thread that enabled it, run the jobs here instead of on the worker
+    app.worker.synchronous = True
+    profile = cProfile.Profile()
+    profile.enable()
+    for _ in range(repeat):
+        run_ui_events(app, events)
+    profile.disable()
+    app.destroy()
+    profile.dump_stats(output)
+    return profile
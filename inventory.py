@@ -0,0 +1,128 @@
+import numpy as np
+from decay import decay_matrix, take_valid, to_datetime64
+
+CHUNK_SIZE = 10000
+
+
+class SourceInventory:
+    def __init__(self, isotopes, halflife, line_offsets, lines, numbers, isotope_index, serials, prod_dates,
+                 original_activities):
+        self._isotopes = np.asarray(isotopes, dtype=str)
+        self._halflife_table = np.asarray(halflife, dtype=float)
+        self._line_offsets = np.asarray(line_offsets, dtype=np.int64)
+        self._lines = np.asarray(lines, dtype=float).reshape(-1, 2)
+        self._index = {isotope: i for i, isotope in enumerate(self._isotopes.tolist())}
+        self._numbers = np.asarray(numbers, dtype=np.int64)
+        self._isotope_index = np.asarray(isotope_index, dtype=np.int64)
+        self._serials = np.asarray(serials, dtype=str)
+        self._prod_dates = np.asarray(prod_dates, dtype=str)
+        self._dates = to_datetime64(self._prod_dates)
+        self._original_activities = np.round(np.asarray(original_activities, dtype=float))
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        return cls(snapshot.isotopes, snapshot.halflife, snapshot.line_offsets, snapshot.line_table,
+                   snapshot.source_id, snapshot.source_isotope, snapshot.source_serial, snapshot.source_prod_date,
+                   snapshot.source_activity)
+
+    @classmethod
+    def from_database(cls, database):
+        isotopes = database.halflife.Isotope.tolist()
+        lines = [database.read('Lines', isotope) for isotope in isotopes]
+        counts = [len(line) for line in lines]
+        index = {isotope: i for i, isotope in enumerate(isotopes)}
+        sources = database.sources
+        return cls(isotopes, database.halflife.Half_life_d, np.concatenate([[0], np.cumsum(counts)]),
+                   np.concatenate([np.reshape(line, (-1, 2)) for line in lines]) if lines else np.zeros((0, 2)),
+                   sources.Number, [index.get(isotope, -1) for isotope in sources.Isotope],
+                   [str(serial) for serial in sources.SourceNumber], sources.ProductionDate,
+                   sources.OriginalActivity_Bq)
+
+    @property
+    def isotopes(self):
+        return self._isotopes
+
+    @property
+    def numbers(self):
+        return self._numbers
+
+    @property
+    def isotope_index(self):
+        return self._isotope_index
+
+    @property
+    def valid(self):
+        # False for sources whose isotope has no Halflife row
+        return self._isotope_index >= 0
+
+    @property
+    def names(self):
+        return take_valid(self._isotopes, self._isotope_index, '')
+
+    @property
+    def serials(self):
+        return self._serials
+
+    @property
+    def prod_dates(self):
+        return self._prod_dates
+
+    @property
+    def dates(self):
+        return self._dates
+
+    @property
+    def original_activities(self):
+        return self._original_activities
+
+    @property
+    def halflife(self):
+        return take_valid(self._halflife_table, self._isotope_index, np.nan)
+
+    def __len__(self):
+        return len(self._numbers)
+
+    def index_of(self, name):
+        return self._index[name]
+
+    def halflife_of(self, name):
+        return float(self._halflife_table[self._index[name]])
+
+    def lines_of(self, name):
+        index = self._index.get(name)
+        if index is None:
+            return np.zeros((0, 2))
+        return self._lines[self._line_offsets[index]:self._line_offsets[index + 1]]
+
+    def require(self, rows=slice(None)):
+        missing = self._numbers[rows][self._isotope_index[rows] < 0]
+        if len(missing):
+            raise KeyError(f"no half-life for source(s) {', '.join(str(number) for number in missing)}")
+
+    def decay(self, dates, rows=slice(None)):
+        self.require(rows)
+        return decay_matrix(self._original_activities[rows], self._halflife_table[self._isotope_index[rows]],
+                            self._dates[rows], to_datetime64(np.atleast_1d(dates)))
+
+    def current_activity(self, date, rows=slice(None)):
+        return self.decay([date], rows)[:, 0]
+
+    def evaluate(self, engine, date, distances, materials='Air', thicknesses=0., dose_type='Ambient',
+                 chunk_size=CHUNK_SIZE, calculate=None):
+        # sources without a half-life are left as nan
+        calculate = calculate or engine.calculate
+        valid = np.flatnonzero(self.valid)
+        activities = self.current_activity(date, valid)
+        names = self.names[valid]
+        distances, materials, thicknesses = np.broadcast_arrays(
+            np.asarray(distances, dtype=float), np.asarray(materials, dtype=str), np.asarray(thicknesses, dtype=float))
+        distances, materials, thicknesses = [np.broadcast_to(values, (len(self),))[valid]
+                                             for values in (distances, materials, thicknesses)]
+        totals = np.full((3, len(self)), np.nan)
+        for start in range(0, len(valid), chunk_size):
+            rows = slice(start, start + chunk_size)
+            result = calculate(names[rows], activities[rows], distances[rows], materials[rows], thicknesses[rows],
+                               dose_type)
+            totals[:, valid[rows]] = result.total_flux, result.total_kerma_rate, result.total_dose_rate
+        return totals
+
@@ -0,0 +1,121 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import subprocess
+import numpy as np
+
+SERVICE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'service.py')
+ISOTOPES = ['Cs-137', 'Co-60', 'Am-241', 'Eu-152', 'Ba-133', 'Na-22']
+MATERIALS = ['Air', 'Iron', 'Lead', 'Aluminium', 'Copper', 'Tin', 'PMMA']
+
+
+def scenarios(rng, n):
+    return [{'isotope': str(rng.choice(ISOTOPES)), 'activity': float(rng.uniform(1e6, 1e10)),
+             'distance': float(rng.choice([10, 50, 100, 200])), 'material': str(rng.choice(MATERIALS)),
+             'thickness': float(rng.choice([0, 0.5, 1, 2]))} for _ in range(n)]
+
+
+async def request(reader, writer, host, method, path, payload):
+    body = json.dumps(payload).encode() if payload is not None else b''
+    writer.write(f'{method} {path} HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n'
+                 f'Content-Length: {len(body)}\r\n\r\n'.encode() + body)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.strip().lower() == 'content-length':
+            length = int(value)
+    return status, json.loads(await reader.readexactly(length))
+
+
+async def client(host, port, payloads, path, latencies, errors):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for payload in payloads:
+            start = time.perf_counter()
+            status, _ = await request(reader, writer, host, 'POST', path, payload)
+            latencies.append(time.perf_counter() - start)
+            if status != 200:
+                errors.append(status)
+    finally:
+        writer.close()
+
+
+async def load(host, port, path, payloads, concurrency):
+    latencies = []
+    errors = []
+    start = time.perf_counter()
+    await asyncio.gather(*[client(host, port, payloads[i::concurrency], path, latencies, errors)
+                           for i in range(concurrency)])
+    return time.perf_counter() - start, np.array(latencies), errors
+
+
+async def wait_ready(host, port, timeout=60.):
+    deadline = time.perf_counter() + timeout
+    while True:
+        try:
+            reader, writer = await asyncio.open_connection(host, port)
+            status, health = await request(reader, writer, host, 'GET', '/health', None)
+            writer.close()
+            return health
+        except OSError:
+            if time.perf_counter() > deadline:
+                raise
+            await asyncio.sleep(0.1)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Load test of the local calculation service')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--endpoint', choices=['scenario', 'batch'], default='scenario')
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--batch-size', type=int, default=1000, help='scenarios per /batch request')
+    parser.add_argument('--spawn', action='store_true', help='start service.py for the duration of the test')
+    parser.add_argument('--workers', type=int, default=1, help='workers of the spawned service')
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    args = parser.parse_args(argv)
+
+    process = None
+    if args.spawn:
+        process = subprocess.Popen([sys.executable, SERVICE, '--host', args.host, '--port', str(args.port),
+                                    '--workers', str(args.workers)])
+    try:
+        asyncio.run(wait_ready(args.host, args.port))
+        rng = np.random.default_rng(0)
+        if args.endpoint == 'scenario':
+            payloads = scenarios(rng, args.requests)
+            per_request = 1
+        else:
+            payloads = [{'scenarios': scenarios(rng, args.batch_size)} for _ in range(args.requests)]
+            per_request = args.batch_size
+        elapsed, latencies, errors = asyncio.run(load(args.host, args.port, '/' + args.endpoint, payloads,
+                                                      args.concurrency))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    report = {'endpoint': args.endpoint, 'requests': len(latencies), 'concurrency': args.concurrency,
+              'errors': len(errors), 'elapsed_s': elapsed, 'requests_per_s': len(latencies) / elapsed,
+              'scenarios_per_s': len(latencies) * per_request / elapsed,
+              'p50_ms': float(np.percentile(latencies, 50)) * 1000, 'p99_ms': float(np.percentile(latencies, 99)) * 1000,
+              'max_ms': float(latencies.max()) * 1000}
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        for key, value in report.items():
+            print(f'{key:16s} {value:.3f}' if isinstance(value, float) else f'{key:16s} {value}')
+    return 1 if errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
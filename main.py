@@ -1,7 +1,30 @@
+import sys
+import json
+import argparse
+import instrumentation
 from frontend import *
 import tkcalendar
 import babel.numbers
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Gamma dose-rate and flux calculator')
+    parser.add_argument('--profile', metavar='REPORT', help=f'write stage timers and counters to a JSON or CSV file '
+                                                            f'(same as {instrumentation.ENV_VAR}=REPORT)')
+    parser.add_argument('--profile-ui', metavar='EVENTS', help='run a JSON list of [field, value] UI events under '
+                                                               'cProfile instead of starting the GUI')
+    parser.add_argument('--profile-output', default='ui.prof', help='cProfile output of --profile-ui')
+    args = parser.parse_args()
+
+    if args.profile:
+        instrumentation.enable(args.profile)
+    else:
+        instrumentation.enable_from_env()
+
+    if args.profile_ui:
+        with open(args.profile_ui) as f:
+            events = json.load(f)
+        instrumentation.profile_ui(events, args.profile_output)
+        sys.exit()
+
     App = MainApp()
-    App.mainloop()
\ No newline at end of file
+    App.mainloop()
@@ -0,0 +1,197 @@
+import threading
+import numpy as np
+from beckend import registry
+from cache import result_cache
+
+INPUTS = ['lines', 'activity', 'distance', 'shield', 'dose_type']
+STAGES = [
+    ('energy', ['lines']),
+    ('yields', ['lines']),
+    ('geometry', ['distance']),
+    ('shield_values', ['energy', 'shield']),
+    ('air_values', ['energy', 'distance']),
+    ('kerma_values', ['energy']),
+    ('h10_values', ['energy', 'dose_type']),
+    ('unit', ['lines', 'distance', 'shield', 'dose_type']),
+    ('flux', ['unit', 'activity']),
+    ('kerma_rate', ['unit', 'activity']),
+    ('dose_rate', ['unit', 'activity']),
+]
+OUTPUTS = ['energy', 'flux', 'kerma_rate', 'dose_rate']
+
+
+class Pipeline:
+    def __init__(self, source, shield, air_shield, dose_type, cache=result_cache):
+        self._source = source
+        self._shield = shield
+        self._air_shield = air_shield
+        self._dose_type = dose_type
+        self._cache = cache
+        self._values = {}
+        self._dirty = {name for name, _ in STAGES}
+        self._dependents = {name: [] for name in INPUTS}
+        for name, inputs in STAGES:
+            self._dependents[name] = []
+            for parent in inputs:
+                self._dependents[parent].append(name)
+        self._recomputed = []
+        # update may run on the background worker while the GUI invalidates
+        self._lock = threading.RLock()
+        self._version = 0
+
+    @property
+    def source(self):
+        return self._source
+
+    @property
+    def shield(self):
+        return self._shield
+
+    @property
+    def air_shield(self):
+        return self._air_shield
+
+    @property
+    def dose_type(self):
+        return self._dose_type
+
+    @property
+    def cache(self):
+        return self._cache
+
+    @property
+    def dirty(self):
+        return bool(self._dirty)
+
+    @property
+    def recomputed(self):
+        return self._recomputed
+
+    @property
+    def energy(self):
+        return self._values['energy']
+
+    @property
+    def flux(self):
+        return self._values['flux']
+
+    @property
+    def kerma_rate(self):
+        return self._values['kerma_rate']
+
+    @property
+    def dose_rate(self):
+        return self._values['dose_rate']
+
+    @source.setter
+    def source(self, value):
+        with self._lock:
+            self._source = value
+        self.invalidate('lines', 'activity', 'distance')
+
+    @shield.setter
+    def shield(self, value):
+        with self._lock:
+            self._shield = value
+        self.invalidate('shield')
+
+    def configure_source(self, *changed, decay=False, **values):
+        # the GUI changes inputs only through these, so an update on the worker never mixes old and new values
+        with self._lock:
+            for name, value in values.items():
+                setattr(self._source, name, value)
+            if decay:
+                self._source.decay()
+            self.invalidate(*changed)
+
+    def configure_shield(self, **values):
+        with self._lock:
+            for name, value in values.items():
+                setattr(self._shield, name, value)
+            self.invalidate('shield')
+
+    def configure_dose_type(self, **values):
+        with self._lock:
+            for name, value in values.items():
+                setattr(self._dose_type, name, value)
+            self.invalidate('dose_type')
+
+    def invalidate(self, *names):
+        with self._lock:
+            stack = list(names)
+            while stack:
+                name = stack.pop()
+                for dependent in self._dependents[name]:
+                    if dependent not in self._dirty:
+                        self._dirty.add(dependent)
+                        stack.append(dependent)
+
+    def value(self, name):
+        if name in self._dirty or name not in self._values:
+            self._values[name] = getattr(self, '_' + name)()
+            self._dirty.discard(name)
+            self._recomputed.append(name)
+        return self._values[name]
+
+    def update(self):
+        with self._lock:
+            self._recomputed = []
+            for name in OUTPUTS:
+                self.value(name)
+            if self._recomputed:
+                self._version += 1
+            return bool(self._recomputed)
+
+    def results(self):
+        # the version lets the caller skip rendering when nothing changed since the last results it displayed,
+        # a superseded job may have done the recomputation
+        with self._lock:
+            self.update()
+            return self._version, self._source.lines, self._values['flux'], self._values['kerma_rate'], \
+                self._values['dose_rate']
+
+    def _energy(self):
+        return self._source.lines[:, 0]
+
+    def _yields(self):
+        return self._source.lines[:, 1] / 100
+
+    def _geometry(self):
+        return np.arcsin(np.sin(0.5 / self._source.distance) ** 2) / np.pi
+
+    def _shield_values(self):
+        self._shield.attenuation(self.value('energy'))
+        return self._shield.attenuation_values
+
+    def _air_values(self):
+        self._air_shield.thickness = self._source.distance
+        self._air_shield.attenuation(self.value('energy'))
+        return self._air_shield.attenuation_values
+
+    def _kerma_values(self):
+        return registry.values(self._dose_type.kerma_coeffs, self.value('energy')) * 3600
+
+    def _h10_values(self):
+        return registry.values(self._dose_type.coefficients, self.value('energy'))
+
+    def _unit(self):
+        key = (self._source.name, float(self._source.distance), self._shield.material, float(self._shield.thickness),
+               self._dose_type.type)
+        unit = self._cache.get(key) if self._cache is not None else None
+        if unit is None:
+            flux = self.value('yields') * self.value('geometry') * self.value('shield_values') * self.value('air_values')
+            kerma_rate = self.value('kerma_values') * flux
+            dose_rate = kerma_rate * self.value('h10_values')
+            unit = (flux, kerma_rate, dose_rate)
+            if self._cache is not None:
+                unit = self._cache.put(key, *unit)
+        return unit
+
+    def _flux(self):
+        return self.value('unit')[0] * self._source.current_activity
+
+    def _kerma_rate(self):
+        return self.value('unit')[1] * self._source.current_activity
+
+    def _dose_rate(self):
+        return self.value('unit')[2] * self._source.current_activity
@@ -0,0 +1,178 @@
+import itertools
+import numpy as np
+
+CHUNK_ROWS = 10000
+
+
+def nnls(gram, projection, tolerance=None, iterations=None):
+    # Lawson-Hanson active set on the normal equations (Bro and de Jong), min |R a - m| for a >= 0
+    # with gram = R^T R and projection = R^T m, so R itself never has to be held in memory
+    gram = np.asarray(gram, dtype=float)
+    projection = np.asarray(projection, dtype=float)
+    size = len(projection)
+    # unit-activity responses span many decades, equilibrate the columns first
+    scale = np.sqrt(np.diag(gram))
+    scale = np.where(scale > 0, scale, 1.)
+    gram = gram / np.outer(scale, scale)
+    projection = projection / scale
+    if tolerance is None:
+        tolerance = 10 * np.finfo(float).eps * size * max(np.abs(gram).max(initial=0.),
+                                                          np.abs(projection).max(initial=0.))
+    iterations = iterations or 3 * size + 10
+    x = np.zeros(size)
+    passive = np.zeros(size, dtype=bool)
+    gradient = projection.copy()
+    for _ in range(iterations):
+        if passive.all() or np.where(passive, -np.inf, gradient).max(initial=-np.inf) <= tolerance:
+            break
+        passive[np.argmax(np.where(passive, -np.inf, gradient))] = True
+        while True:
+            trial = np.zeros(size)
+            trial[passive] = np.linalg.lstsq(gram[np.ix_(passive, passive)], projection[passive], rcond=None)[0]
+            if not passive.any() or trial[passive].min() > 0:
+                break
+            # step back to the first variable that would turn negative and drop it from the passive set
+            blocking = passive & (trial <= 0)
+            step = x[blocking] - trial[blocking]
+            alpha = np.min(np.divide(x[blocking], step, out=np.zeros(len(step)), where=step > 0))
+            x = x + alpha * (trial - x)
+            passive &= x > tolerance
+            x[~passive] = 0.
+        x = trial
+        gradient = projection - gram @ x
+    return x / scale
+
+
+def measurement_chunks(rows, chunk_rows=CHUNK_ROWS, relative_error=None):
+    # survey readings with x, y, z (cm), dose_rate (uSv/h) and optional material, thickness, uncertainty
+    rows = iter(rows)
+    while True:
+        chunk = list(itertools.islice(rows, chunk_rows))
+        if not chunk:
+            break
+        points = np.array([[float(row['x']), float(row['y']), float(row['z'])] for row in chunk])
+        dose_rates = np.array([float(row['dose_rate']) for row in chunk])
+        materials = np.array([str(row.get('material') or 'Air') for row in chunk])
+        thicknesses = np.array([float(row.get('thickness') or 0) for row in chunk])
+        sigma = np.array([float(row.get('uncertainty') or 0) for row in chunk])
+        if relative_error is not None:
+            sigma = np.where(sigma > 0, sigma, relative_error * np.abs(dose_rates))
+        sigma = np.where(sigma > 0, sigma, 1.)
+        yield points, materials, thicknesses, dose_rates, sigma
+
+
+class ReconstructionResult:
+    def __init__(self, activities, std, chi2, count, rms):
+        self._activities = activities
+        self._std = std
+        self._chi2 = chi2
+        self._count = count
+        self._rms = rms
+
+    @property
+    def activities(self):
+        return self._activities
+
+    @property
+    def std(self):
+        return self._std
+
+    @property
+    def chi2(self):
+        return self._chi2
+
+    @property
+    def count(self):
+        return self._count
+
+    @property
+    def rms(self):
+        return self._rms
+
+    @property
+    def dof(self):
+        return max(self._count - int(np.count_nonzero(self._activities)), 1)
+
+    @property
+    def reduced_chi2(self):
+        return self._chi2 / self.dof
+
+
+class ActivityReconstruction:
+    def __init__(self, engine, isotopes, positions, dose_type='Ambient', min_distance=1., calculate=None):
+        self._engine = engine
+        self._calculate = calculate or engine.calculate
+        self._isotopes = np.atleast_1d(np.asarray(isotopes, dtype=str))
+        self._positions = np.asarray(positions, dtype=float).reshape(len(self._isotopes), 3)
+        self._dose_type = dose_type
+        self._min_distance = min_distance
+        size = len(self._isotopes)
+        self._gram = np.zeros((size, size))
+        self._projection = np.zeros(size)
+        self._sum_squares = 0.
+        self._count = 0
+
+    @property
+    def isotopes(self):
+        return self._isotopes
+
+    @property
+    def positions(self):
+        return self._positions
+
+    @property
+    def gram(self):
+        return self._gram
+
+    @property
+    def projection(self):
+        return self._projection
+
+    @property
+    def count(self):
+        return self._count
+
+    def response(self, points, materials='Air', thicknesses=0.):
+        # dose rate of every candidate source at unit activity, (readings, sources)
+        points = np.asarray(points, dtype=float).reshape(-1, 3)
+        distance = np.sqrt(((points[:, None, :] - self._positions[None, :, :]) ** 2).sum(axis=-1))
+        distance = np.maximum(distance, self._min_distance)
+        materials = np.broadcast_to(np.asarray(materials, dtype=str), len(points))[:, None]
+        thicknesses = np.broadcast_to(np.asarray(thicknesses, dtype=float), len(points))[:, None]
+        return self._calculate(self._isotopes[None, :], 1., distance, materials, thicknesses,
+                               self._dose_type).total_dose_rate
+
+    def add(self, points, materials, thicknesses, dose_rates, sigma=1.):
+        dose_rates = np.asarray(dose_rates, dtype=float)
+        sigma = np.broadcast_to(np.asarray(sigma, dtype=float), dose_rates.shape)
+        weighted = self.response(points, materials, thicknesses) / sigma[:, None]
+        measured = dose_rates / sigma
+        self._gram += weighted.T @ weighted
+        self._projection += weighted.T @ measured
+        self._sum_squares += measured @ measured
+        self._count += len(dose_rates)
+
+    def add_chunks(self, chunks, progress=None):
+        for chunk in chunks:
+            self.add(*chunk)
+            if progress is not None:
+                progress(self._count)
+        return self._count
+
+    def solve(self):
+        activities = nnls(self._gram, self._projection)
+        # weighted residual sum of squares without a second pass over the readings
+        chi2 = max(self._sum_squares - 2 * activities @ self._projection + activities @ self._gram @ activities, 0.)
+        std = np.zeros(len(activities))
+        active = activities > 0
+        if active.any():
+            dof = max(self._count - int(np.count_nonzero(active)), 1)
+            # scaled by the reduced chi-square, so plain uSv/h readings without uncertainties still get a spread
+            covariance = np.linalg.pinv(self._gram[np.ix_(active, active)]) * chi2 / dof
+            std[active] = np.sqrt(np.maximum(np.diag(covariance), 0.))
+        rms = np.sqrt(chi2 / self._count) if self._count else 0.
+        return ReconstructionResult(activities, std, chi2, self._count, rms)
+
+    def residuals(self, activities, points, materials, thicknesses, dose_rates):
+        predicted = self.response(points, materials, thicknesses) @ activities
+        return predicted, np.asarray(dose_rates, dtype=float) - predicted
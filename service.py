@@ -0,0 +1,258 @@
+import sys
+import json
+import signal
+import asyncio
+import argparse
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import numpy as np
+import instrumentation
+from cli import DEFAULT_DB, calculate_chunk, init_engine
+from decay import DecayProjection, date_range, to_datetime64, DATE_FORMAT
+from snapshot import load_snapshot
+
+MAX_BODY = 64 * 2 ** 20
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 413: 'Payload Too Large',
+           422: 'Unprocessable Entity', 500: 'Internal Server Error'}
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class Coalescer:
+    def __init__(self, service, window=0.002, max_size=1000):
+        self._service = service
+        self._window = window
+        self._max_size = max_size
+        self._pending = []
+        self._timer = None
+        self._batches = 0
+
+    @property
+    def pending(self):
+        return len(self._pending)
+
+    @property
+    def batches(self):
+        return self._batches
+
+    async def submit(self, row):
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((row, future))
+        if len(self._pending) >= self._max_size:
+            self.flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self._window, self.flush)
+        return await future
+
+    def flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, []
+        self._batches += 1
+        asyncio.ensure_future(self._run(pending))
+
+    async def _run(self, pending):
+        try:
+            totals, lines = await self._service.run(calculate_chunk, 0, [row for row, _ in pending], True)
+        except Exception as e:
+            for _, future in pending:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        by_scenario = [[] for _ in pending]
+        for line in lines:
+            by_scenario[line['scenario']].append(line)
+        for (_, future), total, scenario_lines in zip(pending, totals, by_scenario):
+            if not future.done():
+                future.set_result((total, scenario_lines))
+
+
+class Service:
+    def __init__(self, db_name=DEFAULT_DB, workers=1, window=0.002, max_batch=1000, chunk_size=10000,
+                 cache_size=None):
+        self._db_name = db_name
+        # build the snapshot cache once here, workers then map the same read-only files
+        self._snapshot = load_snapshot(db_name)
+        self._projection = DecayProjection(self._snapshot)
+        self._workers = workers
+        self._chunk_size = chunk_size
+        if workers > 0:
+            self._pool = ProcessPoolExecutor(workers, initializer=init_engine, initargs=(db_name, cache_size))
+        else:
+            init_engine(db_name, cache_size)
+            self._pool = ThreadPoolExecutor(1)
+        self._coalescer = Coalescer(self, window, max_batch)
+        self._requests = 0
+        self._routes = {
+            ('GET', '/health'): self.health,
+            ('POST', '/scenario'): self.scenario,
+            ('POST', '/batch'): self.batch,
+            ('POST', '/decay'): self.decay,
+        }
+
+    @property
+    def coalescer(self):
+        return self._coalescer
+
+    def close(self):
+        self._pool.shutdown(cancel_futures=True)
+
+    async def run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._pool, func, *args)
+
+    async def health(self, body):
+        return {'status': 'ok', 'isotopes': len(self._snapshot.isotopes), 'sources': len(self._snapshot.source_id),
+                'workers': self._workers, 'requests': self._requests, 'coalesced_batches': self._coalescer.batches,
+                'pending': self._coalescer.pending}
+
+    async def scenario(self, body):
+        if not isinstance(body, dict):
+            raise HTTPError(400, 'expected a JSON object with isotope, activity and distance')
+        total, lines = await self._coalescer.submit(body)
+        if total.get('error'):
+            raise HTTPError(400, total['error'])
+        total = {key: value for key, value in total.items() if key not in ('scenario', 'error')}
+        total['lines'] = [{key: value for key, value in line.items() if key not in ('scenario', 'id')}
+                          for line in lines]
+        return total
+
+    async def batch(self, body):
+        rows = body.get('scenarios') if isinstance(body, dict) else body
+        if not isinstance(rows, list):
+            raise HTTPError(400, "expected a list of scenarios or an object with 'scenarios'")
+        per_line = bool(body.get('lines')) if isinstance(body, dict) else False
+        parts = await asyncio.gather(*[self.run(calculate_chunk, start, rows[start:start + self._chunk_size], per_line)
+                                       for start in range(0, len(rows), self._chunk_size)])
+        result = {'results': [total for totals, _ in parts for total in totals]}
+        if per_line:
+            result['lines'] = [line for _, lines in parts for line in lines]
+        return result
+
+    async def decay(self, body):
+        if not isinstance(body, dict):
+            raise HTTPError(400, 'expected a JSON object')
+        if 'dates' in body:
+            dates = to_datetime64(body['dates'])
+        else:
+            dates = date_range(body['start'], body['stop'], body.get('step', 'D'))
+        rows = self._projection.rows
+        if body.get('sources') is not None:
+            ids = np.asarray(body['sources'], dtype=np.int64)
+            if not np.isin(ids, self._snapshot.source_id).all():
+                raise HTTPError(404, 'unknown source id')
+            rows = np.searchsorted(self._snapshot.source_id, ids)
+            try:
+                self._projection.require(rows)
+            except KeyError as e:
+                raise HTTPError(422, e.args[0])
+        activity = await asyncio.get_running_loop().run_in_executor(None, self._projection.project, dates, rows)
+        ids = np.asarray(self._snapshot.source_id)[rows]
+        return {'dates': [date.strftime(DATE_FORMAT) for date in dates.tolist()],
+                'sources': [{'id': int(i), 'isotope': str(isotope), 'serial': str(serial), 'activity': values}
+                            for i, isotope, serial, values in zip(ids.tolist(), self._projection.isotope[rows],
+                                                                  self._projection.serial[rows], activity.tolist())]}
+
+    async def dispatch(self, method, path, body):
+        self._requests += 1
+        path = path.split('?', 1)[0]
+        handler = self._routes.get((method, path))
+        if handler is None:
+            if any(route_path == path for _, route_path in self._routes):
+                raise HTTPError(405, f'{method} not allowed on {path}')
+            raise HTTPError(404, f'no such endpoint {path}')
+        try:
+            payload = json.loads(body) if body else {}
+        except ValueError as e:
+            raise HTTPError(400, f'invalid JSON: {e}')
+        try:
+            return await handler(payload)
+        except (KeyError, ValueError, TypeError) as e:
+            raise HTTPError(400, f'{type(e).__name__}: {e}')
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                method, path, version = request_line.decode('latin-1').split()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get('content-length', 0))
+                try:
+                    if length > MAX_BODY:
+                        raise HTTPError(413, f'request body over {MAX_BODY} bytes')
+                    body = await reader.readexactly(length) if length else b''
+                    status, payload = 200, await self.dispatch(method, path, body)
+                except HTTPError as e:
+                    status, payload = e.status, {'error': str(e)}
+                except Exception as e:
+                    status, payload = 500, {'error': f'{type(e).__name__}: {e}'}
+                keep_alive = headers.get('connection', '').lower() != 'close' and version == 'HTTP/1.1'
+                data = json.dumps(payload).encode()
+                writer.write(f'HTTP/1.1 {status} {REASONS[status]}\r\nContent-Type: application/json\r\n'
+                             f'Content-Length: {len(data)}\r\n'
+                             f'Connection: {"keep-alive" if keep_alive else "close"}\r\n\r\n'.encode() + data)
+                await writer.drain()
+                if not keep_alive or status == 413:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+
+async def serve(service, host='127.0.0.1', port=8765, ready=None):
+    server = await asyncio.start_server(service.handle, host, port)
+    address = server.sockets[0].getsockname()
+    print(f'listening on http://{address[0]}:{address[1]}', file=sys.stderr, flush=True)
+    if ready is not None:
+        ready(address)
+    async with server:
+        await server.serve_forever()
+
+
+def interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Local HTTP/JSON dose-rate calculation service')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--db', default=DEFAULT_DB, help='SQLite database with nuclear data')
+    parser.add_argument('--workers', type=int, default=1, help='calculation processes, 0 runs them in a thread')
+    parser.add_argument('--window-ms', type=float, default=2., help='time single scenarios wait to be coalesced')
+    parser.add_argument('--max-batch', type=int, default=1000, help='coalesced scenarios per worker call')
+    parser.add_argument('--chunk-size', type=int, default=10000, help='scenarios per worker call for /batch')
+    parser.add_argument('--cache-size', type=int, default=0,
+                        help='unit-activity results kept per worker, 0 disables the cache (default 0)')
+    parser.add_argument('--profile', metavar='REPORT', help='write stage timers and counters to a JSON or CSV file')
+    args = parser.parse_args(argv)
+    if args.profile:
+        instrumentation.enable(args.profile)
+    else:
+        instrumentation.enable_from_env()
+    signal.signal(signal.SIGTERM, interrupt)
+    service = Service(args.db, args.workers, args.window_ms / 1000, args.max_batch, args.chunk_size, args.cache_size)
+    try:
+        asyncio.run(serve(service, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,284 @@
+import os
+import math
+import json
+import warnings
+import numpy as np
+from decay import iso_date
+from storage import connect, has_table, quote
+
+SNAPSHOT_VERSION = 4
+ALIGN = 64
+WAL_HEADER = 32
+ARRAYS = ['isotopes', 'halflife', 'line_offsets', 'lines',
+          'materials', 'material_offsets', 'material_table',
+          'dose_types', 'dose_offsets', 'dose_table',
+          'source_id', 'source_isotope', 'source_name', 'source_serial', 'source_prod_date', 'source_date',
+          'source_activity',
+          'chain_parent', 'chain_daughter', 'chain_branching']
+
+
+class Snapshot:
+    def __init__(self, name, arrays):
+        self._name = name
+        self._arrays = arrays
+        self._isotope_index = {isotope: i for i, isotope in enumerate(arrays['isotopes'].tolist())}
+        self._material_index = {material: i for i, material in enumerate(arrays['materials'].tolist())}
+        self._dose_index = {dose_type: i for i, dose_type in enumerate(arrays['dose_types'].tolist())}
+
+    @property
+    def name(self):
+        return self._name
+
+    @property
+    def arrays(self):
+        return self._arrays
+
+    @property
+    def isotopes(self):
+        return self._arrays['isotopes']
+
+    @property
+    def halflife(self):
+        return self._arrays['halflife']
+
+    @property
+    def line_offsets(self):
+        return self._arrays['line_offsets']
+
+    @property
+    def line_table(self):
+        return self._arrays['lines']
+
+    @property
+    def materials(self):
+        return self._arrays['materials']
+
+    @property
+    def dose_types(self):
+        return self._arrays['dose_types']
+
+    @property
+    def source_id(self):
+        return self._arrays['source_id']
+
+    @property
+    def source_isotope(self):
+        return self._arrays['source_isotope']
+
+    @property
+    def source_name(self):
+        return self._arrays['source_name']
+
+    @property
+    def orphan_sources(self):
+        return self._arrays['source_id'][self._arrays['source_isotope'] < 0]
+
+    @property
+    def source_serial(self):
+        return self._arrays['source_serial']
+
+    @property
+    def source_prod_date(self):
+        return self._arrays['source_prod_date']
+
+    @property
+    def source_date(self):
+        return self._arrays['source_date']
+
+    @property
+    def source_activity(self):
+        return self._arrays['source_activity']
+
+    @property
+    def chain_parent(self):
+        return self._arrays['chain_parent']
+
+    @property
+    def chain_daughter(self):
+        return self._arrays['chain_daughter']
+
+    @property
+    def chain_branching(self):
+        return self._arrays['chain_branching']
+
+    def isotope_index(self, name):
+        return self._isotope_index[name]
+
+    def halflife_of(self, name):
+        return float(self._arrays['halflife'][self._isotope_index[name]])
+
+    def lines(self, name):
+        index = self._isotope_index.get(name)
+        if index is None:
+            return np.zeros((0, 2))
+        offsets = self._arrays['line_offsets']
+        return self._arrays['lines'][offsets[index]:offsets[index + 1]]
+
+    def material(self, name):
+        index = self._material_index[name]
+        offsets = self._arrays['material_offsets']
+        return self._arrays['material_table'][offsets[index]:offsets[index + 1]]
+
+    def dose_coefficients(self, name):
+        index = self._dose_index[name]
+        offsets = self._arrays['dose_offsets']
+        return self._arrays['dose_table'][offsets[index]:offsets[index + 1]]
+
+    def read(self, table, name):
+        if table == 'Lines':
+            return self.lines(name)
+        elif table == 'Materials':
+            return self.material(name)
+        elif table == 'DoseConversionCoefficients':
+            return self.dose_coefficients(name)
+        raise KeyError(f'{table} is not part of the snapshot')
+
+
+def coefficient_columns(cur, table):
+    res = cur.execute(f'pragma table_info({quote(table)})')
+    return [row[1] for row in res.fetchall() if row[1] != 'Energy']
+
+
+def coefficient_csr(cur, table):
+    columns = coefficient_columns(cur, table)
+    offsets = [0]
+    rows = []
+    for column in columns:
+        res = cur.execute(f'select Energy, {quote(column)} from {quote(table)} where {quote(column)} is not null '
+                          'order by Energy asc')
+        data = res.fetchall()
+        rows.extend(data)
+        offsets.append(len(rows))
+    return np.array(columns), np.array(offsets, dtype=np.int64), np.array(rows, dtype=float).reshape(-1, 2)
+
+
+def build_snapshot(name):
+    con = connect(name)
+    try:
+        cur = con.cursor()
+        halflife = cur.execute('select * from Halflife order by Isotope asc').fetchall()
+        isotopes = [row[0] for row in halflife]
+        isotope_index = {isotope: i for i, isotope in enumerate(isotopes)}
+
+        lines = cur.execute('select isotope, energy, yield from Lines order by energy asc').fetchall()
+        lines = [row for row in lines if row[0] in isotope_index]
+        lines.sort(key=lambda row: isotope_index[row[0]])
+        counts = np.bincount([isotope_index[row[0]] for row in lines], minlength=len(isotopes))
+        line_offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+
+        materials, material_offsets, material_table = coefficient_csr(cur, 'Materials')
+        dose_types, dose_offsets, dose_table = coefficient_csr(cur, 'DoseConversionCoefficients')
+
+        sources = cur.execute('select * from Sources order by id asc').fetchall()
+        chains = []
+        if has_table(con, 'DecayChains'):
+            chains = cur.execute('select Parent, Daughter, Branching from DecayChains order by Parent, Daughter').fetchall()
+    finally:
+        con.close()
+
+    prod_dates = [row[3] for row in sources]
+    arrays = {
+        'isotopes': np.array(isotopes, dtype=str),
+        'halflife': np.array([row[1] for row in halflife], dtype=float),
+        'line_offsets': line_offsets,
+        'lines': np.array([row[1:] for row in lines], dtype=float).reshape(-1, 2),
+        'materials': materials,
+        'material_offsets': material_offsets,
+        'material_table': material_table,
+        'dose_types': dose_types,
+        'dose_offsets': dose_offsets,
+        'dose_table': dose_table,
+        'source_id': np.array([row[0] for row in sources], dtype=np.int64),
+        'source_isotope': np.array([isotope_index.get(row[1], -1) for row in sources], dtype=np.int64),
+        'source_name': np.array([str(row[1]) for row in sources], dtype=str),
+        'source_serial': np.array([str(row[2]) for row in sources], dtype=str),
+        'source_prod_date': np.array(prod_dates, dtype=str),
+        'source_date': np.array([iso_date(d) for d in prod_dates], dtype='datetime64[D]'),
+        'source_activity': np.array([row[4] for row in sources], dtype=float),
+        'chain_parent': np.array([row[0] for row in chains], dtype=str),
+        'chain_daughter': np.array([row[1] for row in chains], dtype=str),
+        'chain_branching': np.array([row[2] for row in chains], dtype=float),
+    }
+    orphans = [f'{row[0]} ({row[1]})' for row in sources if row[1] not in isotope_index]
+    if orphans:
+        warnings.warn(f"{name}: no Halflife row for the isotope of source(s) {', '.join(orphans)}, "
+                      'they are left out of decay and dose calculations', stacklevel=2)
+    return Snapshot(name, arrays)
+
+
+def cache_path(name):
+    return name + '.snapshot'
+
+
+def db_stamp(name):
+    stat = os.stat(name)
+    stamp = {'version': SNAPSHOT_VERSION, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+    try:
+        with open(name + '-wal', 'rb') as f:
+            header = f.read(WAL_HEADER)
+            size = os.fstat(f.fileno()).st_size
+    except OSError:
+        header = b''
+    if len(header) == WAL_HEADER:
+        # committed but not yet checkpointed writes live in the WAL file. Connections create and touch it without
+        # changing any data, so only its length and the salts that change on every WAL restart count
+        stamp['wal'] = [size, header[16:24].hex()]
+    return stamp
+
+
+def save_snapshot(snapshot, path):
+    # one file: a JSON header line with the stamp and the dtype, shape and offset of every array, then their data
+    arrays = {key: np.ascontiguousarray(snapshot.arrays[key]) for key in ARRAYS}
+    layout = {}
+    offset = 0
+    for key, values in arrays.items():
+        offset = -(-offset // ALIGN) * ALIGN
+        layout[key] = [values.dtype.str, list(values.shape), offset]
+        offset += values.nbytes
+    header = json.dumps({'stamp': db_stamp(snapshot.name), 'arrays': layout}).encode()
+    header += b' ' * (-(len(header) + 1) % ALIGN) + b'\n'
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(header)
+        for key, values in arrays.items():
+            f.seek(len(header) + layout[key][2])
+            values.tofile(f)
+        f.truncate(len(header) + offset)
+    os.replace(tmp_path, path)
+
+
+def read_cache(name, path):
+    try:
+        with open(path, 'rb') as f:
+            header = f.readline()
+        header_data = json.loads(header)
+        if header_data['stamp'] != db_stamp(name):
+            return None
+        size = os.path.getsize(path) - len(header)
+        # plain views of the one mapping, the memmap subclass costs more per array than the arrays themselves
+        blob = np.memmap(path, dtype=np.uint8, mode='r', offset=len(header)).view(np.ndarray) if size else \
+            np.zeros(0, np.uint8)
+        arrays = {}
+        for key in ARRAYS:
+            dtype, shape, offset = header_data['arrays'][key]
+            dtype = np.dtype(dtype)
+            count = math.prod(shape)
+            arrays[key] = blob[offset:offset + count * dtype.itemsize].view(dtype).reshape(shape)
+    except (OSError, ValueError, KeyError):
+        return None
+    return Snapshot(name, arrays)
+
+
+def load_snapshot(name, cache=True):
+    path = cache_path(name)
+    if cache:
+        snapshot = read_cache(name, path)
+        if snapshot is not None:
+            return snapshot
+    snapshot = build_snapshot(name)
+    if cache:
+        try:
+            save_snapshot(snapshot, path)
+        except OSError:
+            pass
+    return snapshot
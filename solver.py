@@ -0,0 +1,72 @@
+import numpy as np
+
+
+def solve_thickness(dose_rate, mu, target, tolerance=1e-9, iterations=100):
+    dose_rate, mu = np.broadcast_arrays(np.asarray(dose_rate, dtype=float), np.asarray(mu, dtype=float))
+    shape = dose_rate.shape[:-1]
+    dose_rate = dose_rate.reshape(-1, dose_rate.shape[-1])
+    mu = mu.reshape(dose_rate.shape)
+    target = np.broadcast_to(np.asarray(target, dtype=float), shape).ravel()
+    unshielded = dose_rate.sum(axis=-1)
+    active = dose_rate > 0
+    mu_min = np.where(active, mu, np.inf).min(axis=-1, initial=np.inf)
+    thickness = np.where(unshielded > target, np.inf, 0.0)
+    rows = np.flatnonzero((unshielded > target) & (target > 0) & (mu_min > 0) & np.isfinite(mu_min))
+
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        log_dose_rate = np.where(active[rows], np.log(dose_rate[rows]), -np.inf)
+        mu = mu[rows]
+        log_target = np.log(target[rows])
+        # sum(c * exp(-mu * t)) <= sum(c) * exp(-mu_min * t), so this thickness is always enough
+        upper = (np.log(unshielded[rows]) - log_target) / mu_min[rows]
+        lower = np.zeros(len(rows))
+        t = np.zeros(len(rows))
+        for _ in range(iterations):
+            exponent = log_dose_rate - mu * t[:, None]
+            peak = exponent.max(axis=-1)
+            weights = np.exp(exponent - peak[:, None])
+            total = weights.sum(axis=-1)
+            residual = peak + np.log(total) - log_target
+            slope = -(weights * mu).sum(axis=-1) / total
+            lower = np.where(residual > 0, t, lower)
+            upper = np.where(residual > 0, upper, t)
+            step = t - residual / slope
+            bisect = ~np.isfinite(step) | (step <= lower) | (step >= upper)
+            step = np.where(bisect, (lower + upper) / 2, step)
+            converged = np.abs(step - t) <= tolerance * (1 + step)
+            thickness[rows[converged]] = step[converged]
+            keep = ~converged
+            if not keep.any():
+                break
+            rows, log_dose_rate, mu, log_target = rows[keep], log_dose_rate[keep], mu[keep], log_target[keep]
+            upper, lower, t = upper[keep], lower[keep], step[keep]
+        else:
+            thickness[rows] = t
+
+    return thickness.reshape(shape)
+
+
+class ThicknessSolver:
+    def __init__(self, engine, tolerance=1e-9, iterations=100):
+        self._engine = engine
+        self._tolerance = tolerance
+        self._iterations = iterations
+
+    @property
+    def engine(self):
+        return self._engine
+
+    def solve(self, isotopes, activities, distances, target, materials=None, dose_type='Ambient'):
+        if materials is None:
+            materials = self._engine.materials()
+        isotopes, activities, distances, target = np.broadcast_arrays(
+            np.atleast_1d(np.asarray(isotopes, dtype=str)), np.asarray(activities, dtype=float),
+            np.asarray(distances, dtype=float), np.asarray(target, dtype=float))
+
+        names, index = np.unique(isotopes, return_inverse=True)
+        index = index.reshape(isotopes.shape)
+        energy, _ = self._engine.line_table(names)
+        mu = np.moveaxis(self._engine.material_values(materials, names, energy)[:, index], 0, -2)
+        dose_rate = self._engine.calculate(isotopes, activities, distances, materials[0], 0., dose_type).dose_rate
+        thickness = solve_thickness(dose_rate[..., None, :], mu, target[..., None], self._tolerance, self._iterations)
+        return materials, thickness
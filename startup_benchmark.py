@@ -0,0 +1,115 @@
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+TARGET = 1.0
+PAINT_SCRIPT = '''
+import sys
+import json
+import time
+start = float(sys.argv[1])
+marks = {'imported': time.time()}
+import main
+import frontend
+load_data = frontend.MainApp.load_data
+
+
+def timed_load_data(self):
+    load_data(self)
+    marks['data'] = time.time()
+
+
+def exposed(event):
+    # widgets redraw at idle time after the Expose, the mark follows them
+    app.after_idle(lambda: marks.setdefault('paint', time.time()))
+
+
+frontend.MainApp.load_data = timed_load_data
+marks['imported'] = time.time()
+app = frontend.MainApp()
+app.bind('<Expose>', exposed, add='+')
+while 'data' not in marks:
+    app.update()
+app.destroy()
+print(json.dumps({key: value - start for key, value in marks.items()}))
+'''
+
+
+def import_times(module='main'):
+    res = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                         cwd=HERE, capture_output=True, text=True, check=True)
+    modules = []
+    for line in res.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, self_us, cumulative_us, name = [part for part in line.replace('import time:', '|').split('|')]
+        modules.append({'module': name.strip(), 'level': (len(name) - len(name.lstrip()) - 1) // 2,
+                        'self': int(self_us) / 1e6, 'cumulative': int(cumulative_us) / 1e6})
+    return modules
+
+
+def first_paint():
+    start = time.time()
+    res = subprocess.run([sys.executable, '-c', PAINT_SCRIPT, repr(start)], cwd=HERE, capture_output=True, text=True)
+    if res.returncode != 0:
+        return None, res.stderr.strip().splitlines()[-1] if res.stderr.strip() else 'failed'
+    return json.loads(res.stdout.strip().splitlines()[-1]), None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Measure import time and time to first paint of the GUI')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=10)
+    parser.add_argument('--target', type=float, default=TARGET, help='seconds to first paint')
+    parser.add_argument('--json', help='write the report to this file')
+    args = parser.parse_args(argv)
+
+    imports = []
+    for _ in range(args.runs):
+        modules = import_times()
+        imports.append(sum(module['cumulative'] for module in modules if module['level'] == 0))
+    local = {os.path.splitext(name)[0] for name in os.listdir(HERE) if name.endswith('.py')}
+    heaviest = sorted([module for module in modules if '.' not in module['module'] and module['module'] not in local],
+                      key=lambda module: -module['cumulative'])
+
+    paints = []
+    error = None
+    for _ in range(args.runs):
+        marks, error = first_paint()
+        if marks is None:
+            break
+        paints.append(marks)
+
+    report = {'import_time': min(imports), 'heaviest_imports': heaviest[:args.top],
+              'loaded': sorted({module['module'] for module in modules} & {'pandas', 'scipy', 'matplotlib'}),
+              'target': args.target}
+    if paints:
+        report['first_paint'] = min(marks['paint'] for marks in paints)
+        report['data_loaded'] = min(marks['data'] for marks in paints)
+    else:
+        report['first_paint_error'] = error
+
+    print(f"import time: {report['import_time']:.3f} s")
+    for module in report['heaviest_imports']:
+        print(f"    {module['cumulative']:.3f} s  {module['module']}")
+    if report['loaded']:
+        print(f"heavy modules imported at startup: {', '.join(report['loaded'])}")
+    if paints:
+        print(f"first paint: {report['first_paint']:.3f} s, data loaded: {report['data_loaded']:.3f} s "
+              f"(target {args.target:.3f} s)")
+    else:
+        print(f'first paint not measured: {error}')
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    measured = report.get('first_paint', report['import_time'])
+    return 0 if measured <= args.target else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,159 @@
+import os
+import itertools
+import threading
+import sqlite3 as sq
+from contextlib import contextmanager
+
+TABLES = ['Sources', 'Halflife', 'Lines', 'Materials', 'DoseConversionCoefficients', 'DecayChains']
+MIGRATIONS = [
+    (1, ['create index if not exists Lines_Isotope_Energy on Lines(Isotope, Energy)']),
+    # left empty: Lines of the catalogue parents already hold the lines of their daughters in equilibrium
+    (2, ['create table if not exists DecayChains (Parent text not null, Daughter text not null, '
+         'Branching real not null default 1, primary key (Parent, Daughter))']),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+BATCH_SIZE = 1000
+
+
+def quote(identifier):
+    return '"' + identifier.replace('"', '""') + '"'
+
+
+def connect(name, readonly=True):
+    if readonly:
+        con = sq.connect(f'file:{os.path.abspath(name)}?mode=ro', uri=True)
+        con.execute('pragma query_only = on')
+    else:
+        con = sq.connect(name)
+    return con
+
+
+def has_table(con, table):
+    return con.execute("select 1 from sqlite_master where type = 'table' and name = ?", (table,)).fetchone() is not None
+
+
+def schema_version(name):
+    con = connect(name)
+    try:
+        return con.execute('pragma user_version').fetchone()[0]
+    finally:
+        con.close()
+
+
+def migrate(name):
+    con = connect(name, readonly=False)
+    try:
+        version = con.execute('pragma user_version').fetchone()[0]
+        for target, statements in MIGRATIONS:
+            if target <= version:
+                continue
+            with con:
+                for statement in statements:
+                    con.execute(statement)
+                con.execute(f'pragma user_version = {int(target)}')
+            version = target
+        if con.execute('pragma journal_mode').fetchone()[0] != 'wal':
+            con.execute('pragma journal_mode = wal')
+    finally:
+        con.close()
+    return version
+
+
+class ConnectionPool:
+    def __init__(self, name):
+        self._name = name
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = []
+        self._columns = {}
+        self._pid = os.getpid()
+
+    @property
+    def name(self):
+        return self._name
+
+    def connection(self):
+        if self._pid != os.getpid():
+            # forked worker, connections of the parent must not be shared
+            self._local = threading.local()
+            self._connections = []
+            self._pid = os.getpid()
+        con = getattr(self._local, 'connection', None)
+        if con is None:
+            con = self._local.connection = connect(self._name)
+            with self._lock:
+                self._connections.append(con)
+        return con
+
+    def execute(self, sql, parameters=()):
+        return self.connection().execute(sql, parameters)
+
+    def columns(self, table):
+        if table not in TABLES:
+            raise KeyError(f'unknown table {table}')
+        columns = self._columns.get(table)
+        if columns is None:
+            columns = self._columns[table] = [row[1] for row in self.execute(f'pragma table_info({quote(table)})')]
+        return columns
+
+    def column(self, table, name):
+        if name not in self.columns(table):
+            raise KeyError(f'{table} has no column {name}')
+        return quote(name)
+
+    def close(self):
+        with self._lock:
+            for con in self._connections:
+                con.close()
+            self._connections = []
+        self._local = threading.local()
+
+    @contextmanager
+    def writer(self):
+        con = connect(self._name, readonly=False)
+        try:
+            with con:
+                yield con
+        finally:
+            con.close()
+        self._columns.clear()
+
+    def insert_rows(self, table, columns, rows, replace=False, batch_size=BATCH_SIZE, progress=None, key=None):
+        # tables without a natural primary key name a key column instead, replace then drops the stored rows of
+        # every key value in the input before its first rows go in, all in the one transaction
+        names = ', '.join(self.column(table, column) for column in columns)
+        verb = 'insert or replace' if replace else 'insert'
+        sql = f'{verb} into {quote(table)} ({names}) values ({", ".join("?" * len(columns))})'
+        clear = None
+        if replace and key is not None:
+            clear = f'delete from {quote(table)} where {self.column(table, key)} = ?'
+            position = columns.index(key)
+            cleared = set()
+        count = 0
+        rows = iter(rows)
+        with self.writer() as con:
+            while True:
+                batch = list(itertools.islice(rows, batch_size))
+                if not batch:
+                    break
+                if clear is not None:
+                    values = {row[position] for row in batch} - cleared
+                    con.executemany(clear, [(value,) for value in values])
+                    cleared |= values
+                con.executemany(sql, batch)
+                count += len(batch)
+                if progress is not None:
+                    progress(count)
+        return count
+
+    def delete_rows(self, table, column, values, batch_size=BATCH_SIZE):
+        sql = f'delete from {quote(table)} where {self.column(table, column)} = ?'
+        count = 0
+        values = iter(values)
+        with self.writer() as con:
+            while True:
+                batch = [(value,) for value in itertools.islice(values, batch_size)]
+                if not batch:
+                    break
+                count += con.executemany(sql, batch).rowcount
+        return count
@@ -0,0 +1,168 @@
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from beckend import registry
+from decay import decay_days
+
+CHUNK_SIZE = 100000
+BINS = 4096
+DECADES = 4
+QUANTITIES = ['flux', 'kerma_rate', 'dose_rate']
+
+_model = None
+
+
+class StreamingStats:
+    # Chan/Welford mean and variance plus a log-spaced histogram around the nominal value for percentiles
+    def __init__(self, nominal, bins=BINS, decades=DECADES):
+        nominal = nominal if nominal > 0 else 1.
+        self._edges = np.logspace(np.log10(nominal) - decades, np.log10(nominal) + decades, bins + 1)
+        self._histogram = np.zeros(bins + 2, dtype=np.int64)
+        self._count = 0
+        self._mean = 0.
+        self._m2 = 0.
+        self._min = np.inf
+        self._max = -np.inf
+
+    @property
+    def count(self):
+        return self._count
+
+    @property
+    def mean(self):
+        return self._mean
+
+    @property
+    def std(self):
+        return np.sqrt(self._m2 / (self._count - 1)) if self._count > 1 else 0.
+
+    @property
+    def min(self):
+        return self._min
+
+    @property
+    def max(self):
+        return self._max
+
+    def update(self, values):
+        values = np.asarray(values, dtype=float).ravel()
+        if not len(values):
+            return
+        mean = values.mean()
+        m2 = ((values - mean) ** 2).sum()
+        self._combine(len(values), mean, m2)
+        self._min = min(self._min, values.min())
+        self._max = max(self._max, values.max())
+        self._histogram += np.bincount(np.searchsorted(self._edges, values, side='right'),
+                                       minlength=len(self._histogram))
+
+    def merge(self, other):
+        self._combine(other._count, other._mean, other._m2)
+        self._min = min(self._min, other._min)
+        self._max = max(self._max, other._max)
+        self._histogram += other._histogram
+
+    def _combine(self, count, mean, m2):
+        total = self._count + count
+        if not total:
+            return
+        delta = mean - self._mean
+        self._mean += delta * count / total
+        self._m2 += m2 + delta ** 2 * self._count * count / total
+        self._count = total
+
+    def percentile(self, q):
+        # bin 0 and the last bin collect values outside the histogram range, clamped to the observed extremes
+        edges = np.concatenate([[min(self._min, self._edges[0])], self._edges, [max(self._max, self._edges[-1])]])
+        cumulative = np.cumsum(self._histogram)
+        target = np.asarray(q, dtype=float) / 100 * self._count
+        index = np.clip(np.searchsorted(cumulative, target, side='left'), 0, len(self._histogram) - 1)
+        below = np.where(index > 0, cumulative[index - 1], 0)
+        fraction = np.where(self._histogram[index] > 0, (target - below) / np.maximum(self._histogram[index], 1), 0.)
+        return edges[index] + (edges[index + 1] - edges[index]) * np.clip(fraction, 0., 1.)
+
+    def summary(self, percentiles=(2.5, 50, 97.5)):
+        result = {'count': self._count, 'mean': float(self._mean), 'std': float(self.std), 'min': float(self._min),
+                  'max': float(self._max)}
+        result.update({f'p{q:g}': float(value) for q, value in zip(percentiles, self.percentile(percentiles))})
+        return result
+
+
+class UncertaintyModel:
+    def __init__(self, engine, isotope, activity, prod_date, cur_date, distance, material='Air', thickness=0.,
+                 dose_type='Ambient', activity_rsd=0., prod_date_sd=0., distance_sd=0., thickness_sd=0.):
+        lines = engine.lines(isotope)
+        energy = lines[:, 0]
+        self._yields = lines[:, 1] / 100
+        self._mu_shield = registry.values(engine.material(material), energy)
+        self._mu_air = registry.values(engine.material('Air'), energy)
+        self._kerma = registry.values(engine.dose_type('Kerma'), energy) * 3600
+        self._h10 = registry.values(engine.dose_type(dose_type), energy)
+        self._rate = 0.693 / engine.halflife(isotope)
+        self._activity = activity
+        self._days = decay_days(prod_date, cur_date)
+        self._distance = distance
+        self._thickness = thickness
+        self._activity_rsd = activity_rsd
+        self._prod_date_sd = prod_date_sd
+        self._distance_sd = distance_sd
+        self._thickness_sd = thickness_sd
+
+    def nominal(self):
+        values = self.evaluate(np.array([self._activity]), np.array([float(self._days)]), np.array([self._distance]),
+                               np.array([self._thickness]))
+        return [float(value[0]) for value in values]
+
+    def evaluate(self, activity, days, distance, thickness):
+        current = activity * np.exp(-self._rate * days)
+        s_a = np.arcsin(np.sin(0.5 / distance) ** 2) / np.pi
+        flux = (self._yields * np.exp(-thickness[:, None] * self._mu_shield - distance[:, None] * self._mu_air)) * \
+            (current * s_a)[:, None]
+        kerma_rate = flux * self._kerma
+        return flux.sum(axis=-1), kerma_rate.sum(axis=-1), (kerma_rate * self._h10).sum(axis=-1)
+
+    def sample(self, rng, n):
+        activity = np.maximum(self._activity * (1 + self._activity_rsd * rng.standard_normal(n)), 0.)
+        days = self._days + self._prod_date_sd * rng.standard_normal(n)
+        distance = np.maximum(self._distance + self._distance_sd * rng.standard_normal(n), 1e-3)
+        thickness = np.maximum(self._thickness + self._thickness_sd * rng.standard_normal(n), 0.)
+        return self.evaluate(activity, days, distance, thickness)
+
+
+def init_model(model):
+    global _model
+    _model = model
+
+
+def run_chunk(seed, size):
+    rng = np.random.default_rng(seed)
+    nominal = _model.nominal()
+    stats = [StreamingStats(value) for value in nominal]
+    for stat, values in zip(stats, _model.sample(rng, size)):
+        stat.update(values)
+    return stats
+
+
+def propagate(model, samples, seed=None, chunk_size=CHUNK_SIZE, workers=1, progress=None):
+    # one child seed per chunk, so results do not depend on the number of workers
+    sizes = [min(chunk_size, samples - start) for start in range(0, samples, chunk_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    stats = [StreamingStats(value) for value in model.nominal()]
+    done = 0
+    if workers <= 1:
+        init_model(model)
+        results = (run_chunk(child, size) for child, size in zip(seeds, sizes))
+        pool = None
+    else:
+        pool = ProcessPoolExecutor(workers, initializer=init_model, initargs=(model,))
+        results = pool.map(run_chunk, seeds, sizes)
+    try:
+        for size, chunk in zip(sizes, results):
+            for stat, part in zip(stats, chunk):
+                stat.merge(part)
+            done += size
+            if progress is not None:
+                progress(done, samples)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    return dict(zip(QUANTITIES, stats))
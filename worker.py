@@ -0,0 +1,208 @@
+import sys
+import queue
+import threading
+import traceback
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+
+POLL_MS = 16
+
+
+class Cancelled(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, key, generation):
+        self._key = key
+        self._generation = generation
+        self._cancelled = threading.Event()
+        self._progress = None
+        self._future = None
+
+    @property
+    def key(self):
+        return self._key
+
+    @property
+    def generation(self):
+        return self._generation
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    @property
+    def progress(self):
+        return self._progress
+
+    @property
+    def future(self):
+        return self._future
+
+    @future.setter
+    def future(self, value):
+        self._future = value
+
+    def cancel(self):
+        self._cancelled.set()
+        if self._future is not None:
+            self._future.cancel()
+
+    def report(self, done, total):
+        # called from the worker, raising here stops cooperative jobs that were superseded
+        if self._cancelled.is_set():
+            raise Cancelled(self._key)
+        self._progress = (done, total)
+
+
+class InlineExecutor:
+    # runs jobs on the calling thread, so profilers and debuggers see them
+    def submit(self, func, *args, **kwargs):
+        future = Future()
+        future.set_running_or_notify_cancel()
+        try:
+            future.set_result(func(*args, **kwargs))
+        except BaseException as e:
+            future.set_exception(e)
+        return future
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        pass
+
+
+class BackgroundWorker:
+    def __init__(self, widget, threads=1, processes=0, poll_ms=POLL_MS):
+        self._widget = widget
+        self._threads = ThreadPoolExecutor(threads, thread_name_prefix='dosecalc')
+        self._processes = ProcessPoolExecutor(processes) if processes else None
+        self._poll_ms = poll_ms
+        self._results = queue.Queue()
+        self._jobs = {}
+        self._callbacks = {}
+        self._generations = {}
+        self._polling = None
+        self._busy_callback = None
+        self._inline = None
+
+    @property
+    def synchronous(self):
+        return self._inline is not None
+
+    @synchronous.setter
+    def synchronous(self, value):
+        self._inline = InlineExecutor() if value else None
+
+    @property
+    def busy(self):
+        return bool(self._jobs)
+
+    @property
+    def jobs(self):
+        return self._jobs
+
+    def on_busy(self, callback):
+        self._busy_callback = callback
+
+    def submit(self, key, func, *args, done=None, error=None, progress=None, process=False, **kwargs):
+        previous = self._jobs.get(key)
+        if previous is not None:
+            previous.cancel()
+        generation = self._generations.get(key, 0) + 1
+        self._generations[key] = generation
+        job = Job(key, generation)
+        if progress is not None and not process:
+            kwargs['progress'] = job.report
+        executor = self._processes if process and self._processes is not None else self._threads
+        if self._inline is not None:
+            executor = self._inline
+        job.future = executor.submit(func, *args, **kwargs)
+        job.future.add_done_callback(lambda future: self._results.put((job, future)))
+        self._jobs[key] = job
+        self._callbacks[key] = (done, error, progress)
+        self._schedule()
+        return job
+
+    def cancel(self, key):
+        job = self._jobs.pop(key, None)
+        if job is not None:
+            job.cancel()
+            self._generations[key] = self._generations.get(key, 0) + 1
+
+    def _schedule(self):
+        if self._polling is None:
+            self._polling = self._widget.after(self._poll_ms, self.poll)
+            if self._busy_callback is not None:
+                self._busy_callback(True, None)
+
+    def poll(self):
+        self._polling = None
+        try:
+            while True:
+                try:
+                    job, future = self._results.get_nowait()
+                except queue.Empty:
+                    break
+                try:
+                    self.deliver(job, future)
+                except Exception:
+                    self.report(*sys.exc_info())
+            for key, job in list(self._jobs.items()):
+                progress = self._callbacks[key][2]
+                if progress is not None and job.progress is not None:
+                    try:
+                        progress(*job.progress)
+                    except Exception:
+                        self.report(*sys.exc_info())
+        finally:
+            # a failing callback must not stop the results of the other jobs from arriving
+            if self._jobs:
+                if self._polling is None:
+                    self._polling = self._widget.after(self._poll_ms, self.poll)
+                if self._busy_callback is not None:
+                    progress = [job.progress for job in self._jobs.values() if job.progress is not None]
+                    self._busy_callback(True, progress[0] if progress else None)
+            elif self._busy_callback is not None:
+                self._busy_callback(False, None)
+
+    def report(self, kind, value, tb):
+        # Tk shows callback errors through report_callback_exception, anything else goes to stderr
+        handler = getattr(self._widget, 'report_callback_exception', None)
+        if handler is not None:
+            handler(kind, value, tb)
+        else:
+            traceback.print_exception(kind, value, tb, file=sys.stderr)
+
+    def deliver(self, job, future):
+        # results of superseded or cancelled jobs are dropped
+        if self._generations.get(job.key) != job.generation or future.cancelled():
+            return
+        self._jobs.pop(job.key, None)
+        done, error, _ = self._callbacks.pop(job.key)
+        exception = future.exception()
+        if exception is None:
+            if done is not None:
+                done(future.result())
+        elif not isinstance(exception, Cancelled):
+            if error is None:
+                self.report(type(exception), exception, exception.__traceback__)
+            else:
+                error(exception)
+
+    def wait(self, timeout=None):
+        for job in list(self._jobs.values()):
+            try:
+                job.future.exception(timeout)
+            except Exception:
+                pass
+        self.poll()
+
+    def shutdown(self):
+        for job in self._jobs.values():
+            job.cancel()
+        self._jobs.clear()
+        if self._polling is not None:
+            self._widget.after_cancel(self._polling)
+            self._polling = None
+        self._threads.shutdown(wait=False, cancel_futures=True)
+        if self._processes is not None:
+            self._processes.shutdown(wait=False, cancel_futures=True)